@@ -0,0 +1,691 @@
+#!/usr/bin/python
+'''
+Implements an in-process stand-in for the oVirt Engine v4 REST API.
+
+It serves a synthetic inventory over HTTP, so that the CLI talks to it
+through the real SDK, exactly as it talks to an engine: SSO login,
+collection listings with search and paging, single objects, add, update,
+remove, host actions, host NICs, VM disk attachments, host and VM
+statistics and the events feed. A latency can be injected in
+every request to model a remote engine.
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may
+not use this file except in compliance with the License. You may obtain
+a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations
+under the License.
+'''
+
+from __future__ import print_function
+import fnmatch
+import json
+import math
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+try:
+    from http.server import BaseHTTPRequestHandler, HTTPServer
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+import ovirtsdk4.types as types
+from ovirtsdk4.reader import Reader
+from ovirtsdk4.writer import Writer
+
+api_prefix = '/ovirt-engine/api'
+sso_prefix = '/ovirt-engine/sso/oauth/'
+sso_logout = '/ovirt-engine/services/sso-logout'
+
+# URL segment: (list element, event attribute, type)
+collections = {
+    'datacenters': ('data_centers', 'data_center', types.DataCenter),
+    'clusters': ('clusters', 'cluster', types.Cluster),
+    'hosts': ('hosts', 'host', types.Host),
+    'storagedomains': ('storage_domains', 'storage_domain',
+                       types.StorageDomain),
+    'templates': ('templates', 'template', types.Template),
+    'vms': ('vms', 'vm', types.Vm),
+}
+
+host_actions = {
+    'activate': types.HostStatus.UP,
+    'deactivate': types.HostStatus.MAINTENANCE,
+}
+
+class Inventory(object):
+    '''
+    The objects served by a MockEngine, and the events of their changes.
+    Objects are kept serialized, so that listing a collection costs the
+    engine side as little as possible and measurements reflect the client.
+    @param deploy_time: Seconds added hosts stay installing before they
+    are up.
+    @type deploy_time: float
+    '''
+    def __init__(self, data_centers=2, clusters=2, hosts=10,
+                 storage_domains=4, templates=2, vms=100, deploy_time=0):
+        self.deploy_time = deploy_time
+        self._lock = threading.Lock()
+        self._objects = dict((name, {}) for name in collections)
+        self._xml = dict((name, {}) for name in collections)
+        self._ready = {}
+        self._events = []
+        self._next_event_id = 1
+        self._populate(data_centers, clusters, hosts, storage_domains,
+                       templates, vms)
+
+    def _populate(self, data_centers, clusters, hosts, storage_domains,
+                  templates, vms):
+        dcs = [types.DataCenter(
+                   id=str(uuid.uuid4()), name='dc%d' % i,
+                   description='Data center %d' % i,
+                   status=types.DataCenterStatus.UP, local=False,
+                   version=types.Version(major=4, minor=5))
+               for i in range(data_centers)]
+        cls = [types.Cluster(
+                   id=str(uuid.uuid4()), name='cluster%d' % i,
+                   description='Cluster %d' % i,
+                   cpu=types.Cpu(type='Intel Nehalem Family',
+                                 architecture=types.Architecture.X86_64),
+                   data_center=types.DataCenter(id=dcs[i % len(dcs)].id)
+                               if dcs else None)
+               for i in range(clusters)]
+        for dc in dcs:
+            self._store('datacenters', dc)
+        for cluster in cls:
+            self._store('clusters', cluster)
+        for i in range(hosts):
+            self._store('hosts', types.Host(
+                id=str(uuid.uuid4()), name='host%d' % i,
+                description='Hypervisor %d' % i,
+                address='10.%d.%d.%d' % (i // 65536, i // 256 % 256,
+                                         i % 256),
+                status=types.HostStatus.UP, type=types.HostType.RHEL,
+                memory=256 * 2 ** 30, max_scheduling_memory=200 * 2 ** 30,
+                cpu=types.Cpu(name='Intel(R) Xeon(R) CPU', speed=2600.0,
+                              topology=types.CpuTopology(
+                                  sockets=2, cores=16, threads=2)),
+                cluster=types.Cluster(id=cls[i % len(cls)].id)
+                        if cls else None))
+        for i in range(storage_domains):
+            self._store('storagedomains', types.StorageDomain(
+                id=str(uuid.uuid4()), name='sd%d' % i,
+                description='Storage domain %d' % i,
+                type=types.StorageDomainType.DATA,
+                status=types.StorageDomainStatus.ACTIVE,
+                available=2 ** 40, used=2 ** 39, committed=2 ** 39,
+                storage=types.HostStorage(type=types.StorageType.NFS,
+                                          address='nfs.example.com',
+                                          path='/export/sd%d' % i)))
+        tpls = [types.Template(
+                    id='00000000-0000-0000-0000-000000000000', name='Blank',
+                    description='Blank template',
+                    status=types.TemplateStatus.OK, memory=2 ** 30)]
+        tpls += [types.Template(
+                     id=str(uuid.uuid4()), name='template%d' % i,
+                     description='Template %d' % i,
+                     status=types.TemplateStatus.OK, memory=4 * 2 ** 30)
+                 for i in range(1, templates)]
+        for template in tpls[:templates]:
+            self._store('templates', template)
+        for i in range(vms):
+            self._store('vms', types.Vm(
+                id=str(uuid.uuid4()), name='vm%d' % i,
+                description='Virtual machine %d' % i,
+                status=types.VmStatus.UP if i % 3 else types.VmStatus.DOWN,
+                memory=4 * 2 ** 30, type=types.VmType.SERVER,
+                os=types.OperatingSystem(type='rhel_8x64'),
+                cpu=types.Cpu(topology=types.CpuTopology(
+                    sockets=1, cores=2, threads=1)),
+                cluster=types.Cluster(id=cls[i % len(cls)].id)
+                        if cls else None,
+                template=types.Template(id=tpls[0].id)))
+
+    def _store(self, collection, entity):
+        self._objects[collection][entity.id] = entity
+        self._xml[collection][entity.id] = Writer.write(entity)
+
+    def _event(self, collection, entity_id, description):
+        tag, attr, entity_type = collections[collection]
+        event = types.Event(id=str(self._next_event_id), code=0,
+                            description=description,
+                            severity=types.LogSeverity.NORMAL)
+        setattr(event, attr, entity_type(id=entity_id))
+        self._next_event_id += 1
+        self._events.append(event)
+
+    def _deploy(self):
+        # Moves the hosts whose deployment is over to up.
+        now = time.time()
+        for host_id, ready in list(self._ready.items()):
+            if ready <= now:
+                del self._ready[host_id]
+                host = self._objects['hosts'].get(host_id)
+                if host is not None:
+                    host.status = types.HostStatus.UP
+                    self._store('hosts', host)
+                    self._event('hosts', host_id, 'Host deployed')
+
+    def count(self, collection, status=None):
+        '''
+        Returns the number of objects of collection, or of the ones with
+        the given status.
+        '''
+        with self._lock:
+            self._deploy()
+            objects = self._objects[collection].values()
+            if status is None:
+                return len(objects)
+            return len([entity for entity in objects
+                        if str(entity.status) == status])
+
+    def list(self, collection, search=None, max=None):
+        '''
+        Returns the XML representation of the objects of collection that
+        match search, honoring 'sortby name', 'page' and max the way the
+        engine does.
+        '''
+        with self._lock:
+            self._deploy()
+            ids = list(self._objects[collection].keys())
+            page = None
+            if search:
+                search, page, sort = parse_search(search)
+                if search:
+                    ids = [entity_id for entity_id in ids
+                           if matches(self._objects[collection][entity_id],
+                                      search)]
+                if sort is not None:
+                    objects = self._objects[collection]
+                    ids.sort(key=lambda entity_id: str(
+                        getattr(objects[entity_id], sort[0], '')),
+                             reverse=sort[1])
+            if max is not None:
+                start = (page - 1) * max if page else 0
+                ids = ids[start:start + max]
+            xml = self._xml[collection]
+            return ''.join(xml[entity_id] for entity_id in ids)
+
+    def get(self, collection, entity_id):
+        with self._lock:
+            self._deploy()
+            return self._xml[collection].get(entity_id)
+
+    def subcollection(self, collection, entity_id, name):
+        '''
+        Returns the XML representation of a subcollection of an object,
+        the NICs of a host or a VM, with their statistics, the disk
+        attachments of a VM or the statistics of either, along with the
+        list element, or None if there is no such object. They are derived
+        from the object and the time, see load().
+        '''
+        with self._lock:
+            entity = self._objects[collection].get(entity_id)
+        if entity is None:
+            return None
+        now = time.time()
+        if collection == 'hosts' and name == 'nics':
+            return 'host_nics', ''.join(Writer.write(types.HostNic(
+                id=str(uuid.uuid5(uuid.NAMESPACE_OID, '%s/%d'
+                                  % (entity_id, index))),
+                name='eth%d' % index, speed=10 ** 10,
+                status=types.NicStatus.UP,
+                ip=types.Ip(address=entity.address) if index == 0 else None,
+                statistics=nic_statistics(entity_id, index, now),
+                host=types.Host(id=entity_id)))
+                for index in range(2))
+        if collection == 'vms' and name == 'nics':
+            return 'nics', Writer.write(types.Nic(
+                id=str(uuid.uuid5(uuid.NAMESPACE_OID, '%s/0' % entity_id)),
+                name='nic1', statistics=nic_statistics(entity_id, 0, now),
+                vm=types.Vm(id=entity_id)))
+        if collection in ('hosts', 'vms') and name == 'statistics':
+            cpu = 100 * load(entity_id, now)
+            memory = entity.memory or 2 ** 30
+            used = int(memory * (0.2 + 0.7 * load(entity_id, now / 7)))
+            if collection == 'hosts':
+                statistics = [
+                    statistic('cpu.current.user', cpu * 0.8, 'percent'),
+                    statistic('cpu.current.system', cpu * 0.2, 'percent'),
+                    statistic('cpu.current.idle', 100 - cpu, 'percent'),
+                    statistic('memory.total', memory, 'bytes'),
+                    statistic('memory.used', used, 'bytes'),
+                    statistic('memory.free', memory - used, 'bytes'),
+                ]
+            else:
+                statistics = [
+                    statistic('cpu.current.guest', cpu * 0.9, 'percent'),
+                    statistic('cpu.current.hypervisor', cpu * 0.1, 'percent'),
+                    statistic('cpu.current.total', cpu, 'percent'),
+                    statistic('memory.installed', memory, 'bytes'),
+                    statistic('memory.used', used, 'bytes'),
+                ]
+            return 'statistics', ''.join(Writer.write(item)
+                                         for item in statistics)
+        if collection == 'vms' and name == 'diskattachments':
+            disk_id = str(uuid.uuid5(uuid.NAMESPACE_OID, entity_id))
+            return 'disk_attachments', Writer.write(types.DiskAttachment(
+                id=disk_id, bootable=True, active=True,
+                interface=types.DiskInterface.VIRTIO_SCSI,
+                disk=types.Disk(id=disk_id, name='%s_disk' % entity.name,
+                                provisioned_size=20 * 2 ** 30,
+                                actual_size=4 * 2 ** 30),
+                vm=types.Vm(id=entity_id)))
+        return None
+
+    def add(self, collection, entity):
+        with self._lock:
+            entity.id = str(uuid.uuid4())
+            if collection == 'hosts':
+                entity.root_password = None
+                if entity.cluster is not None and entity.cluster.id is None:
+                    for cluster in self._objects['clusters'].values():
+                        if cluster.name == entity.cluster.name:
+                            entity.cluster = types.Cluster(id=cluster.id)
+                entity.status = types.HostStatus.INSTALLING
+                self._ready[entity.id] = time.time() + self.deploy_time
+            self._store(collection, entity)
+            self._event(collection, entity.id, 'Added')
+            return self._xml[collection][entity.id]
+
+    def update(self, collection, entity_id, changes):
+        with self._lock:
+            entity = self._objects[collection].get(entity_id)
+            if entity is None:
+                return None
+            for name in ('name', 'description', 'comment'):
+                value = getattr(changes, name, None)
+                if value is not None:
+                    setattr(entity, name, value)
+            self._store(collection, entity)
+            self._event(collection, entity_id, 'Updated')
+            return self._xml[collection][entity_id]
+
+    def remove(self, collection, entity_id):
+        with self._lock:
+            if entity_id not in self._objects[collection]:
+                return False
+            self._event(collection, entity_id, 'Removed')
+            del self._objects[collection][entity_id]
+            del self._xml[collection][entity_id]
+            return True
+
+    def set_host_status(self, host_id, status):
+        with self._lock:
+            host = self._objects['hosts'].get(host_id)
+            if host is None:
+                return False
+            host.status = status
+            self._store('hosts', host)
+            self._event('hosts', host_id, 'Host is %s' % status)
+            return True
+
+    def events(self, after=None, max=None):
+        '''
+        Returns the XML representation of the events following the event
+        id after, latest first, like the engine does.
+        '''
+        with self._lock:
+            self._deploy()
+            events = self._events
+            if after is not None:
+                events = [event for event in events if int(event.id) > after]
+            events = list(reversed(events))
+            if max is not None:
+                events = events[:max]
+            return ''.join(Writer.write(event) for event in events)
+
+
+def load(entity_id, now):
+    '''
+    Returns the load of an object at a time, between 0 and 1, varying
+    over a minute around a level of its own.
+    '''
+    level = uuid.UUID(entity_id).int % 1000 / 1000.0
+    return level * (0.75 + 0.25 * math.sin(now / 10.0 + level * 6))
+
+def statistic(name, datum, unit, kind=types.StatisticKind.GAUGE):
+    return types.Statistic(
+        name=name, kind=kind, unit=types.StatisticUnit(unit),
+        type=types.ValueType.DECIMAL if unit == 'percent'
+             else types.ValueType.INTEGER,
+        values=[types.Value(datum=float(datum))])
+
+def nic_statistics(entity_id, index, now):
+    # The counters grow with the load of the object, from an epoch.
+    rate = 10 ** 8 * load(entity_id, 0) / (index + 1)
+    total = int(rate * (now - 1.6e9))
+    return [
+        statistic('data.current.rx.bps', 4 * rate, 'bits_per_second'),
+        statistic('data.current.tx.bps', 4 * rate, 'bits_per_second'),
+        statistic('data.total.rx', total // 2, 'bytes',
+                  types.StatisticKind.COUNTER),
+        statistic('data.total.tx', total // 2, 'bytes',
+                  types.StatisticKind.COUNTER),
+    ]
+
+def parse_search(search):
+    '''
+    Splits an engine search query into its 'attr=value' predicates, its
+    page number and its sort order.
+    @return: A tuple ([(attr, pattern)], page or None, (attr, descending)
+    or None).
+    '''
+    page = None
+    sort = None
+    match = re.search(r'\bpage\s+(\d+)', search, re.I)
+    if match:
+        page = int(match.group(1))
+        search = search[:match.start()] + search[match.end():]
+    match = re.search(r'\bsortby\s+(\w+)(?:\s+(asc|desc))?', search, re.I)
+    if match:
+        sort = (match.group(1), (match.group(2) or '').lower() == 'desc')
+        search = search[:match.start()] + search[match.end():]
+    predicates = []
+    for clause in re.split(r'\s+and\s+', search.strip(), flags=re.I):
+        if '=' in clause:
+            attr, value = clause.split('=', 1)
+            predicates.append((attr.strip().lower(), value.strip().lower()))
+    return predicates, page, sort
+
+def matches(entity, predicates):
+    for attr, pattern in predicates:
+        value = getattr(entity, attr, None)
+        if value is None:
+            return False
+        if not fnmatch.fnmatchcase(str(value).lower(), pattern):
+            return False
+    return True
+
+
+class _Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+    # Clients opening many connections at once would otherwise have some
+    # of them retried after a second.
+    request_queue_size = 128
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    # Headers and bodies are written separately, don't let Nagle's algorithm
+    # hold the bodies back until the client acknowledges the headers.
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, code, body='', content_type='application/xml'):
+        if not isinstance(body, bytes):
+            body = body.encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _fault(self, code, reason, detail=''):
+        self._reply(code, Writer.write(types.Fault(reason=reason,
+                                                   detail=detail)))
+
+    def _body(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return self.rfile.read(length) if length else b''
+
+    def _handle(self, method):
+        engine = self.server.engine
+        if engine.latency:
+            time.sleep(engine.latency)
+        url = urlparse(self.path)
+        query = dict((name, values[-1])
+                     for name, values in parse_qs(url.query).items())
+        path = url.path
+
+        if path.startswith(sso_prefix) or path == sso_logout:
+            engine.record(method, 'sso')
+            return self._sso(path, self._body())
+
+        if not path.startswith(api_prefix):
+            return self._fault(404, 'Not Found')
+        authorization = self.headers.get('Authorization') or ''
+        if not engine.is_valid(authorization.replace('Bearer ', '', 1)):
+            self._body()
+            return self._reply(401, '', 'text/html')
+
+        segments = [segment for segment in
+                    path[len(api_prefix):].split('/') if segment]
+        engine.record(method, '/'.join(segments[:1] + ['*'] * len(
+            segments[1:2]) + segments[2:]) or 'api')
+        body = self._body()
+        self._api(method, segments, query, body)
+
+    def _sso(self, path, body):
+        engine = self.server.engine
+        form = dict((name, values[-1]) for name, values
+                    in parse_qs(body.decode('utf-8')).items())
+        if path == sso_logout:
+            engine.revoke(form.get('token'))
+            return self._reply(200, '{}', 'application/json')
+        if engine.password is not None \
+           and form.get('password') != engine.password:
+            return self._reply(200, json.dumps({
+                'error': 'access_denied',
+                'error_description': 'Cannot authenticate user.',
+            }), 'application/json')
+        return self._reply(200, json.dumps({
+            'access_token': engine.login(),
+            'token_type': 'bearer',
+        }), 'application/json')
+
+    def _api(self, method, segments, query, body):
+        inventory = self.server.engine.inventory
+        if not segments:
+            api = types.Api(
+                product_info=types.ProductInfo(
+                    name='oVirt Engine (mock)', vendor='ovirt.org',
+                    version=types.Version(major=4, minor=5,
+                                          full_version='4.5.0-mock')),
+                summary=types.ApiSummary(
+                    hosts=types.ApiSummaryItem(
+                        total=inventory.count('hosts'),
+                        active=inventory.count('hosts', 'up')),
+                    storage_domains=types.ApiSummaryItem(
+                        total=inventory.count('storagedomains'),
+                        active=inventory.count('storagedomains', 'active')),
+                    vms=types.ApiSummaryItem(
+                        total=inventory.count('vms'),
+                        active=inventory.count('vms', 'up'))))
+            return self._reply(200, Writer.write(api))
+
+        collection = segments[0]
+        if collection == 'events' and method == 'GET':
+            after = query.get('from')
+            return self._reply(200, '<events>%s</events>' % inventory.events(
+                int(after) if after is not None else None,
+                int(query['max']) if 'max' in query else None))
+        if collection not in collections:
+            return self._fault(404, 'Not Found')
+        tag = collections[collection][0]
+
+        if len(segments) == 1:
+            if method == 'GET':
+                return self._reply(200, '<%s>%s</%s>' % (tag, inventory.list(
+                    collection, query.get('search'),
+                    int(query['max']) if 'max' in query else None), tag))
+            if method == 'POST':
+                return self._reply(201, inventory.add(collection,
+                                                      Reader.read(body)))
+        elif len(segments) == 2:
+            entity_id = segments[1]
+            if method == 'GET':
+                xml = inventory.get(collection, entity_id)
+            elif method == 'PUT':
+                xml = inventory.update(collection, entity_id,
+                                       Reader.read(body))
+            elif method == 'DELETE':
+                xml = '' if inventory.remove(collection, entity_id) else None
+            else:
+                return self._fault(405, 'Method Not Allowed')
+            if xml is None:
+                return self._fault(404, 'Not Found')
+            return self._reply(200, xml)
+        elif len(segments) == 3 and method == 'GET':
+            listing = inventory.subcollection(collection, segments[1],
+                                              segments[2])
+            if listing is None:
+                return self._fault(404, 'Not Found')
+            return self._reply(200, '<%s>%s</%s>' % (listing[0], listing[1],
+                                                    listing[0]))
+        elif len(segments) == 3 and method == 'POST' \
+                and collection == 'hosts' and segments[2] in host_actions:
+            if not inventory.set_host_status(segments[1],
+                                             host_actions[segments[2]]):
+                return self._fault(404, 'Not Found')
+            return self._reply(200, Writer.write(
+                types.Action(status='complete')))
+        return self._fault(404, 'Not Found')
+
+    def do_GET(self):
+        self._handle('GET')
+
+    def do_POST(self):
+        self._handle('POST')
+
+    def do_PUT(self):
+        self._handle('PUT')
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+
+class MockEngine(object):
+    '''
+    Serves an Inventory over HTTP on a local port, from a background thread.
+    @param inventory: The objects to serve.
+    @type inventory: Inventory
+    @param latency: Seconds each request is delayed by.
+    @type latency: float
+    @param password: The password SSO logins must give, None to accept any.
+    @type password: str or None
+    '''
+    def __init__(self, inventory=None, latency=0, password=None,
+                 host='127.0.0.1', port=0):
+        self.inventory = inventory if inventory is not None else Inventory()
+        self.latency = latency
+        self.password = password
+        self.requests = Counter()
+        self._tokens = set()
+        self._lock = threading.Lock()
+        self._server = _Server((host, port), _Handler)
+        self._server.engine = self
+        self._thread = None
+
+    @property
+    def url(self):
+        '''
+        The base URL to give to the connect command.
+        '''
+        host, port = self._server.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='mock-engine')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def record(self, method, resource):
+        with self._lock:
+            self.requests['%s %s' % (method, resource)] += 1
+
+    def request_count(self):
+        with self._lock:
+            return sum(self.requests.values())
+
+    def reset_requests(self):
+        with self._lock:
+            self.requests.clear()
+
+    def login(self):
+        token = uuid.uuid4().hex
+        with self._lock:
+            self._tokens.add(token)
+        return token
+
+    def revoke(self, token):
+        with self._lock:
+            self._tokens.discard(token)
+
+    def expire_tokens(self):
+        '''
+        Invalidates all the SSO tokens, like an engine restart does.
+        '''
+        with self._lock:
+            self._tokens.clear()
+
+    def is_valid(self, token):
+        with self._lock:
+            return token in self._tokens
+
+
+def main():
+    '''
+    Serves a mock engine in the foreground, for interactive use of the CLI.
+    '''
+    import argparse
+    parser = argparse.ArgumentParser(
+        description='Serve a mock oVirt Engine v4 REST API.')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0,
+                        help='milliseconds added to every request')
+    parser.add_argument('--password', default=None,
+                        help='password SSO logins must give')
+    add_inventory_arguments(parser)
+    args = parser.parse_args()
+
+    engine = MockEngine(make_inventory(args), args.latency / 1000.0,
+                        args.password, port=args.port)
+    print("Serving a mock oVirt Engine on %s" % engine.url, file=sys.stderr)
+    try:
+        engine._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+def add_inventory_arguments(parser):
+    parser.add_argument('--data-centers', type=int, default=2)
+    parser.add_argument('--clusters', type=int, default=2)
+    parser.add_argument('--hosts', type=int, default=10)
+    parser.add_argument('--storage-domains', type=int, default=4)
+    parser.add_argument('--templates', type=int, default=2)
+    parser.add_argument('--vms', type=int, default=100)
+    parser.add_argument('--deploy-time', type=float, default=0,
+                        help='seconds added hosts stay installing')
+
+def make_inventory(args):
+    return Inventory(data_centers=args.data_centers, clusters=args.clusters,
+                     hosts=args.hosts, storage_domains=args.storage_domains,
+                     templates=args.templates, vms=args.vms,
+                     deploy_time=args.deploy_time)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,516 @@
+#!/usr/bin/python
+'''
+Times the hot paths of the CLI against a mock oVirt Engine.
+
+Each benchmark drives the real shell and tree through the real SDK, over
+HTTP to an in-process MockEngine, and reports the wall time of its runs
+and the number of requests the engine received per run. Results can be
+saved to a JSON file, and compared to a previously saved one to catch
+regressions.
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may
+not use this file except in compliance with the License. You may obtain
+a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations
+under the License.
+'''
+
+from __future__ import print_function
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+top_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, top_dir)
+
+from mock_engine import MockEngine, add_inventory_arguments, make_inventory
+
+err = sys.stderr
+benchmarks = []
+# Number of hosts added by each run of the bulkcreate benchmark.
+bulk_hosts = 20
+# Number of named engines the fleet benchmarks connect to, besides the
+# default one.
+fleet_engines = 3
+
+def benchmark(function):
+    '''
+    Registers a benchmark. It is called with a Session once per run, and
+    returns the function to time, so that the preparation of each run is
+    not measured.
+    '''
+    benchmarks.append(function)
+    return function
+
+def budget(seconds):
+    '''
+    Sets the time the fastest run of a benchmark must not exceed.
+    '''
+    def set_budget(function):
+        function.budget = seconds
+        return function
+    return set_budget
+
+def traced(function):
+    '''
+    Makes a benchmark also report the memory its run retains, measured
+    over an extra run, as tracing allocations slows runs down.
+    '''
+    function.traced = True
+    return function
+
+
+class Session(object):
+    '''
+    A CLI shell and tree, for engine. Shell preferences and consoles are
+    shared by all the shells of a process, so sessions reset them to the
+    defaults, and only the token cache is disabled.
+    @param prefs_dir: The shell preferences directory.
+    @type prefs_dir: str
+    '''
+    def __init__(self, engine, prefs_dir):
+        from ovirtcli import load_ui_root
+        from ovirtcli.shell import oVirtCLI
+
+        self.engine = engine
+        self.prefs_dir = prefs_dir
+        self.after = None
+        self.cleanups = []
+        tokens = os.path.join(prefs_dir, 'tokens.json')
+        if os.path.exists(tokens):
+            os.remove(tokens)
+        self.shell = oVirtCLI(prefs_dir)
+        for name, value in oVirtCLI.default_prefs.items():
+            if not name.startswith('log'):
+                self.shell.prefs[name] = value
+        self.shell.prefs['loglevel_console'] = 'error'
+        self.shell.prefs['token_cache'] = False
+        self.shell.con._stdout = open(os.devnull, 'w')
+        self.root = load_ui_root()(self.shell)
+
+    def run(self, cmdline):
+        self.shell.run_cmdline(cmdline)
+
+    def connect(self, name=None):
+        cmdline = 'connect username=admin@internal password=secret ip=%s' \
+                  % self.engine.url
+        if name is not None:
+            cmdline += ' name=%s' % name
+        self.run(cmdline)
+
+    def close(self):
+        for cleanup in self.cleanups:
+            cleanup()
+        if self.root.is_connected():
+            self.root.ui_command_disconnect()
+        self.shell.con._stdout.close()
+        self.shell.con._stdout = sys.stdout
+
+
+def run_python(session, args, check=True):
+    '''
+    Runs a new Python interpreter in the repository, with its home in the
+    session's preferences directory.
+    '''
+    env = dict(os.environ, HOME=session.prefs_dir)
+    call = subprocess.check_call if check else subprocess.call
+    with open(os.devnull, 'w') as devnull:
+        call([sys.executable] + args, cwd=top_dir, env=env, stdout=devnull,
+             stderr=devnull)
+
+@benchmark
+@budget(0.1)
+def startup_version(session):
+    def run():
+        # Like --help, --version exits with -1.
+        run_python(session, ['cli.py', '--version'], check=False)
+    return run
+
+@benchmark
+@budget(0.25)
+def import_tree(session):
+    # The SDK must only be imported once connected.
+    def run():
+        run_python(session, ['-c', 'import sys, ovirtcli.ui_root; '
+                             'sys.exit("ovirtsdk4" in sys.modules)'])
+    return run
+
+@benchmark
+@budget(0.4)
+def startup_oneshot(session):
+    def run():
+        run_python(session, ['cli.py', 'ls'])
+    return run
+
+@benchmark
+@budget(0.15)
+def daemon_oneshot(session):
+    from ovirtcli.daemon import request
+
+    socket_path = os.path.join(session.prefs_dir, 'daemon.sock')
+    if not session.cleanups:
+        devnull = open(os.devnull, 'w')
+        daemon = subprocess.Popen(
+            [sys.executable, 'cli.py', '--socket', socket_path, '--daemon'],
+            cwd=top_dir, env=dict(os.environ, HOME=session.prefs_dir),
+            stdout=devnull, stderr=devnull)
+        def stop():
+            request(socket_path, 'exit')
+            daemon.wait()
+            devnull.close()
+        deadline = time.time() + 10
+        while not os.path.exists(socket_path) and time.time() < deadline:
+            time.sleep(0.01)
+        session.cleanups.append(stop)
+        request(socket_path, 'connect username=admin@internal '
+                'password=secret ip=%s' % session.engine.url)
+        request(socket_path, 'ls /Hosts')
+    def run():
+        run_python(session, ['cli.py', '--socket', socket_path, 'ls',
+                             '/Hosts'])
+    return run
+
+@benchmark
+def connect(session):
+    def run():
+        session.connect()
+    session.after = session.root.ui_command_disconnect
+    return run
+
+@benchmark
+def connect_cached_token(session):
+    session.shell.prefs['token_cache'] = True
+    session.shell.prefs['trust_cached_token'] = True
+    if not os.path.exists(os.path.join(session.prefs_dir, 'tokens.json')):
+        session.connect()
+        session.root.ui_command_disconnect()
+    def run():
+        session.connect()
+    session.after = session.root.ui_command_disconnect
+    return run
+
+@benchmark
+def refresh_full(session):
+    session.shell.prefs['lazy_refresh'] = False
+    session.shell.prefs['cache_ttl'] = 0
+    if not session.root.is_connected():
+        session.connect()
+    def run():
+        session.run('/ refresh')
+    return run
+
+@benchmark
+def fleet_refresh(session):
+    # The engines are all the mock engine, which serves requests in
+    # parallel: this takes about as long as refresh_full with --latency.
+    session.shell.prefs['lazy_refresh'] = False
+    session.shell.prefs['cache_ttl'] = 0
+    if not session.root.is_connected():
+        session.connect()
+        for index in range(fleet_engines):
+            session.connect('engine%d' % index)
+    def run():
+        session.run('/ refresh')
+    return run
+
+@benchmark
+def ls_root_cold(session):
+    if not session.root.is_connected():
+        session.connect()
+    session.run('/ refresh')
+    session.run('/ cache flush')
+    def run():
+        session.run('ls /')
+    return run
+
+@benchmark
+def ls_root_warm(session):
+    if not session.root.is_connected():
+        session.connect()
+        session.run('ls /')
+    def run():
+        session.run('ls /')
+    return run
+
+@benchmark
+def hosts_summary(session):
+    if not session.root.is_connected():
+        session.connect()
+    session.run('/ cache flush')
+    hosts = session.root.get_node('/Hosts')
+    def run():
+        hosts.summary()
+    return run
+
+@benchmark
+def count_hosts_down(session):
+    if not session.root.is_connected():
+        session.connect()
+    def run():
+        session.run('/Hosts count query=status=down')
+    return run
+
+@benchmark
+def complete_vm_path(session):
+    if not session.root.is_connected():
+        session.connect()
+        session.run('ls /')
+    def run():
+        session.shell._complete_token_path('/VMs/vm1')
+    return run
+
+@benchmark
+def bulkcreate(session):
+    if not session.root.is_connected():
+        session.connect()
+    session.batch = getattr(session, 'batch', 0) + 1
+    hostsfile = os.path.join(session.prefs_dir, 'hosts.txt')
+    with open(hostsfile, 'w') as hosts:
+        for i in range(bulk_hosts):
+            hosts.write('bench%d-%d 192.168.%d.%d\n'
+                        % (session.batch, i, session.batch % 256, i % 256))
+    def run():
+        session.run('/Hosts bulkcreate hostsfile=%s cluster=cluster0 '
+                    'password=secret' % hostsfile)
+    return run
+
+@benchmark
+def bulk_deactivate(session):
+    if not session.root.is_connected():
+        session.connect()
+        session.run('ls /Hosts')
+    def run():
+        session.run('/Hosts deactivate host1*')
+    session.after = lambda: session.run('/Hosts activate host1*')
+    return run
+
+@benchmark
+def host_details(session):
+    # One NICs request per host, the global 'connections' ones at a time.
+    if not session.root.is_connected():
+        session.connect()
+        session.run('ls /Hosts')
+    def run():
+        session.run('/Hosts details')
+    return run
+
+@benchmark
+def hosts_top(session):
+    # Two requests per host that is up: its statistics and its NICs.
+    if not session.root.is_connected():
+        session.connect()
+        session.run('ls /Hosts')
+    def run():
+        session.run('/Hosts top iterations=1')
+    return run
+
+@benchmark
+def ls_vms_json(session):
+    # The VMs are listed page by page, each written as a JSON line.
+    if not session.root.is_connected():
+        session.connect()
+    def run():
+        session.run('/VMs invalidate')
+        session.run('/ cache flush')
+        session.run('ls /VMs format=json')
+    return run
+
+@benchmark
+@traced
+def build_vms_tree(session):
+    # The VMs are listed from the cache, so that only the tree is built.
+    if not session.root.is_connected():
+        session.connect()
+    vms = session.root.get_node('/VMs')
+    vms.fetch()
+    vms.sync([])
+    def run():
+        vms.refresh()
+    return run
+
+
+def measure_retained(function, session):
+    '''
+    Returns the number of bytes allocated by a run of a benchmark and still
+    in use once it is over.
+    '''
+    import tracemalloc
+
+    session.after = None
+    run = function(session)
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        run()
+        gc.collect()
+        retained = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+    if session.after is not None:
+        session.after()
+    return retained
+
+def run_benchmark(function, engine, prefs_dir, repeat):
+    '''
+    Runs a benchmark repeat times in a fresh session, and returns its
+    timings, the mean number of engine requests per run and, if traced, the
+    memory a run retains.
+    '''
+    session = Session(engine, prefs_dir)
+    timings = []
+    requests = 0
+    try:
+        for _ in range(repeat):
+            session.after = None
+            run = function(session)
+            engine.reset_requests()
+            start = time.time()
+            run()
+            timings.append(time.time() - start)
+            requests += engine.request_count()
+            if session.after is not None:
+                session.after()
+        retained = None
+        if getattr(function, 'traced', False):
+            retained = measure_retained(function, session)
+    finally:
+        session.close()
+    timings.sort()
+    return {
+        'budget': getattr(function, 'budget', None),
+        'min': timings[0],
+        'median': timings[len(timings) // 2],
+        'max': timings[-1],
+        'runs': len(timings),
+        'requests': float(requests) / len(timings),
+        'retained': retained,
+    }
+
+def compare(results, baseline, threshold):
+    '''
+    Prints how results compare to baseline, and returns the names of the
+    benchmarks whose median time grew by more than threshold percents.
+    '''
+    regressions = []
+    print("%-22s %10s %10s %8s" % ('benchmark', 'baseline', 'median',
+                                   'change'))
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            print("%-22s %10s %9.1fms %8s"
+                  % (name, '-', result['median'] * 1000, 'new'))
+            continue
+        change = (result['median'] - before['median']) \
+                 / max(before['median'], 1e-9) * 100
+        flag = ''
+        if change > threshold:
+            regressions.append(name)
+            flag = ' REGRESSION'
+        print("%-22s %9.1fms %9.1fms %+7.1f%%%s"
+              % (name, before['median'] * 1000, result['median'] * 1000,
+                 change, flag))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Benchmark the CLI against a mock oVirt Engine.')
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='runs of each benchmark')
+    parser.add_argument('--latency', type=float, default=0,
+                        help='milliseconds added to every engine request')
+    parser.add_argument('--only', default=None,
+                        help='comma separated benchmarks to run')
+    parser.add_argument('--save', default=None,
+                        help='file to save the results to')
+    parser.add_argument('--compare', default=None,
+                        help='results file to compare with')
+    parser.add_argument('--threshold', type=float, default=10,
+                        help='slowdown percentage reported as a regression')
+    parser.add_argument('--list', action='store_true',
+                        help='list the benchmarks and exit')
+    add_inventory_arguments(parser)
+    parser.set_defaults(data_centers=4, clusters=8, hosts=200,
+                        storage_domains=10, templates=10, vms=5000)
+    args = parser.parse_args()
+
+    if args.list:
+        for function in benchmarks:
+            print(function.__name__)
+        return 0
+
+    selected = benchmarks
+    if args.only:
+        names = args.only.split(',')
+        selected = [function for function in benchmarks
+                    if function.__name__ in names]
+        unknown = set(names) - set(function.__name__ for function in selected)
+        if unknown:
+            print("Unknown benchmarks: %s" % ', '.join(sorted(unknown)),
+                  file=err)
+            return 2
+
+    engine = MockEngine(make_inventory(args), args.latency / 1000.0).start()
+    prefs_dir = tempfile.mkdtemp(prefix='ovirtcli-bench-')
+    results = {}
+    try:
+        for function in selected:
+            result = run_benchmark(function, engine, prefs_dir, args.repeat)
+            results[function.__name__] = result
+            line = "%-22s min %9.1fms  median %9.1fms  %6.1f requests" \
+                   % (function.__name__, result['min'] * 1000,
+                      result['median'] * 1000, result['requests'])
+            if result['retained'] is not None:
+                line += "  %6.1fMB retained" % (result['retained'] / 1e6)
+            if result['budget'] is not None:
+                line += "  (budget %.0fms)" % (result['budget'] * 1000)
+            print(line)
+    finally:
+        engine.stop()
+        shutil.rmtree(prefs_dir, ignore_errors=True)
+
+    if args.save:
+        with open(args.save, 'w') as results_file:
+            json.dump({
+                'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+                'python': platform.python_version(),
+                'inventory': dict((name, getattr(args, name)) for name in (
+                    'data_centers', 'clusters', 'hosts', 'storage_domains',
+                    'templates', 'vms')),
+                'latency': args.latency,
+                'repeat': args.repeat,
+                'results': results,
+            }, results_file, indent=2, sort_keys=True)
+
+    failed = False
+    over_budget = [name for name, result in sorted(results.items())
+                   if result['budget'] is not None
+                   and result['min'] > result['budget']]
+    if over_budget:
+        print("Over budget: %s" % ', '.join(over_budget), file=err)
+        failed = True
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        print()
+        if compare(results, baseline['results'], args.threshold):
+            failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,4 @@
-#!/usr/bin/python2
+#!/usr/bin/python3
 '''
 Starts the oVirtCLI shell.
 
@@ -17,38 +17,30 @@ under the License.
 
 from __future__ import print_function
 
+import os
 from os import getuid
-from ovirtcli import UIRoot
-from configshell_fb import ConfigShell, ExecutionError
+import re
 import sys
-from ovirtcli import __version__ as ovirtcli_version
+import time
+from ovirtcli.version import __version__ as ovirtcli_version
 
 err = sys.stderr
 
-class oVirtCLI(ConfigShell):
-    default_prefs = {'color_path': 'magenta',
-                     'color_command': 'cyan',
-                     'color_parameter': 'magenta',
-                     'color_keyword': 'cyan',
-                     'completions_in_columns': True,
-                     'logfile': None,
-                     'loglevel_console': 'info',
-                     'loglevel_file': 'debug9',
-                     'color_mode': True,
-                     'prompt_length': 30,
-                     'tree_max_depth': 0,
-                     'tree_status_mode': True,
-                     'tree_round_nodes': True,
-                     'tree_show_root': True,
-                     'auto_cd_after_create': False,
-                     'auto_save_on_exit': True,
-                    }
-
 def usage():
-    print("Usage: %s [--version|--help|CMD]" % sys.argv[0], file=err)
+    from ovirtcli.daemon import default_socket
+    print("Usage: %s [--socket PATH] [--version|--help|--daemon|"
+          "--batch FILE [--keep-going]|CMD]" % sys.argv[0], file=err)
     print("  --version\t\tPrint version", file=err)
     print("  --help\t\tPrint this information", file=err)
-    print("  CMD\t\t\tRun ovirtcli shell command and exit", file=err)
+    print("  --batch FILE\t\tRun the ovirtcli shell commands in FILE, or in", file=err)
+    print("  \t\t\tstandard input if FILE is -, over one connection", file=err)
+    print("  --keep-going\t\tIn batch mode, carry on after a failed command", file=err)
+    print("  --daemon\t\tServe the commands of clients on a local socket,", file=err)
+    print("  \t\t\tkeeping the connection and objects between them", file=err)
+    print("  --socket PATH\t\tThe daemon socket, %s by default" % default_socket,
+          file=err)
+    print("  CMD\t\t\tRun ovirtcli shell command and exit, on the daemon if", file=err)
+    print("  \t\t\tone is running", file=err)
     print("  <nothing>\t\tEnter configuration shell", file=err)
     sys.exit(-1)
 
@@ -56,18 +48,97 @@ def version():
     print("%s version %s" % (sys.argv[0], ovirtcli_version), file=err)
     sys.exit(-1)
 
-def main():
+def run_batch(shell, root_node, script, keep_going=False):
     '''
-    Start the oVirtcli shell.
+    Runs the shell commands read from script one after the other, all of
+    them sharing the connection opened by the first 'connect', and reports
+    the status and duration of each one on stderr.
+    Returns the number of failed commands.
     '''
-    shell = oVirtCLI('~/.ovirtcli')
+    failed = 0
+    ran = 0
+    start = time.time()
+    for line in script:
+        cmdline = line.strip()
+        if not cmdline or cmdline.startswith('#'):
+            continue
+        shown = re.sub(r'(password=)\S+', r'\1***', cmdline)
+        ran += 1
+        command_start = time.time()
+        try:
+            shell.run_cmdline(cmdline)
+        except Exception as e:
+            failed += 1
+            print("[FAIL] %7.3fs %s: %s"
+                  % (time.time() - command_start, shown, e), file=err)
+            if not keep_going:
+                break
+        else:
+            print("[ OK ] %7.3fs %s"
+                  % (time.time() - command_start, shown), file=err)
+        if shell._exit:
+            break
+
+    print("%d commands, %d failed, %.3fs"
+          % (ran, failed, time.time() - start), file=err)
+    if root_node.is_connected():
+        root_node.ui_command_disconnect()
+    return failed
+
+def run_on_daemon(socket_path, cmdline):
+    '''
+    Runs a one-shot command on the daemon listening at socket_path, or at
+    the default socket if None, and exits with its status. Returns if no
+    daemon is listening.
+    '''
+    import socket
+    from ovirtcli.daemon import default_socket, request
 
+    socket_path = socket_path or default_socket
+    if not os.path.exists(os.path.expanduser(socket_path)):
+        return
     try:
-        root_node = UIRoot(shell)
-        root_node.refresh()
-    except Exception as error:
-        shell.con.display(shell.con.render_text(str(error), 'red'))
+        stdout, stderr, error = request(socket_path, cmdline)
+    except socket.error:
+        return
+    sys.stdout.write(stdout)
+    sys.stderr.write(stderr)
+    if error is not None:
+        print(error, file=sys.stderr)
+        sys.exit(1)
+    sys.exit(0)
+
+def serve(shell, root_node, socket_path):
+    '''
+    Runs the daemon until it is sent 'exit', or terminated.
+    '''
+    import signal
+    from ovirtcli.daemon import Daemon, default_socket
+
+    daemon = Daemon(shell, root_node, socket_path or default_socket)
+    try:
+        daemon.listen()
+    except Exception as e:
+        print(str(e), file=err)
         sys.exit(-1)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print("Serving on %s" % daemon.path, file=err)
+    try:
+        daemon.serve()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if root_node.is_connected():
+            root_node.ui_command_disconnect()
+
+def main():
+    '''
+    Start the oVirtcli shell.
+    '''
+    socket_path = None
+    if len(sys.argv) > 2 and sys.argv[1] == "--socket":
+        socket_path = sys.argv[2]
+        del sys.argv[1:3]
 
     if len(sys.argv) > 1:
         if sys.argv[1] in ("--help", "-h"):
@@ -76,6 +147,46 @@ def main():
         if sys.argv[1] in ("--version", "-v"):
             version()
 
+        if not sys.argv[1].startswith("--"):
+            run_on_daemon(socket_path, " ".join(sys.argv[1:]))
+
+    # Only import the shell and the tree once the arguments are handled, so
+    # that --version and --help don't pay for them.
+    from ovirtcli import load_ui_root
+    from ovirtcli.shell import oVirtCLI
+
+    shell = oVirtCLI('~/.ovirtcli')
+
+    try:
+        root_node = load_ui_root()(shell)
+    except Exception as error:
+        shell.con.display(shell.con.render_text(str(error), 'red'))
+        sys.exit(-1)
+
+    if len(sys.argv) > 1:
+        if sys.argv[1] == "--daemon":
+            serve(shell, root_node, socket_path)
+            sys.exit(0)
+
+        if sys.argv[1] == "--batch":
+            args = sys.argv[2:]
+            keep_going = "--keep-going" in args
+            if keep_going:
+                args.remove("--keep-going")
+            if len(args) != 1:
+                usage()
+            if args[0] == '-':
+                failed = run_batch(shell, root_node, sys.stdin, keep_going)
+            else:
+                try:
+                    with open(args[0]) as script:
+                        failed = run_batch(shell, root_node, script,
+                                           keep_going)
+                except IOError as e:
+                    print(str(e), file=err)
+                    sys.exit(-1)
+            sys.exit(1 if failed else 0)
+
         try:
             shell.run_cmdline(" ".join(sys.argv[1:]))
         except Exception as e:
@@ -92,10 +203,11 @@ def main():
         except Exception as msg:
             shell.log.error(str(msg))
 
-    root_node.ui_command_disconnect()
+    # Save the objects before the connections are closed.
     if shell.prefs['auto_save_on_exit']:
         shell.log.info("Global pref auto_save_on_exit=true")
         root_node.ui_command_saveconfig()
+    root_node.ui_command_disconnect()
 
 
 if __name__ == "__main__":
@@ -12,5 +12,12 @@ License for the specific language governing permissions and limitations
 under the License.
 '''
 
-from .ui_root import UIRoot
 from .version import __version__
+
+def load_ui_root():
+    '''
+    Imports and returns the UIRoot class. The tree takes long to import,
+    so it is only imported once used.
+    '''
+    from .ui_root import UIRoot
+    return UIRoot
@@ -0,0 +1,128 @@
+'''
+Implements the ovirt4cli background refresh of the loaded objects.
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may
+not use this file except in compliance with the License. You may obtain
+a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations
+under the License.
+'''
+
+import threading
+import time
+
+from .stats import request_stats
+
+class AutoRefresher(object):
+    '''
+    Keeps the API entry points of the engines and their loaded collections
+    current with a single background thread, so that commands find them
+    fresh instead of fetching them. Only the main thread touches the tree:
+    it tells the refresher what to refresh and how often with schedule(),
+    and the objects listed in the background are swapped into their
+    collections before the next command runs, see UIRoot.defer().
+    Listings only go to the collection cache once swapped in, as a command
+    may have listed a collection again meanwhile, see
+    UICollection.apply_listing().
+    @param defer: Called with a callback to run from the main thread.
+    @type defer: callable
+    @param log: The shell log, failures are reported to.
+    '''
+    def __init__(self, defer, log):
+        self._defer = defer
+        self._log = log
+        self._cond = threading.Condition()
+        self._targets = {}
+        self._due = {}
+        self._results = {}
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run,
+                                        name='ovirtcli-refresh')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def schedule(self, targets):
+        '''
+        Sets what to refresh, replacing the previous targets.
+        @param targets: (node, interval, version) tuples: an engine, whose
+        API entry point is read again, or a collection, listed again, every
+        interval seconds. version is the collection's change count, see
+        UICollection.apply_listing(), or None for engines.
+        @type targets: list of tuple
+        '''
+        now = time.time()
+        with self._cond:
+            self._targets = dict((node, (interval, version))
+                                 for node, interval, version in targets)
+            due = {}
+            for node, (interval, version) in self._targets.items():
+                due[node] = min(self._due.get(node, now + interval),
+                                now + interval)
+            self._due = due
+            self._cond.notify_all()
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._targets = {}
+            self._results = {}
+            self._cond.notify_all()
+
+    def _run(self):
+        request_stats.set_thread_origin('auto-refresh')
+        while True:
+            with self._cond:
+                if self._stopped:
+                    return
+                now = time.time()
+                due = [(node, version)
+                       for node, (interval, version) in self._targets.items()
+                       if self._due[node] <= now]
+                if not due:
+                    timeout = None
+                    if self._due:
+                        timeout = min(self._due.values()) - now
+                    self._cond.wait(timeout)
+                    continue
+                for node, version in due:
+                    self._due[node] = now + self._targets[node][0]
+
+            for node, version in due:
+                try:
+                    self._refresh(node, version)
+                except Exception as error:
+                    self._log.debug("Auto refresh of %s failed: %s"
+                                    % (node.path, error))
+
+    def _refresh(self, node, version):
+        cache = node.get_cache()
+        if cache is None:
+            # Disconnected meanwhile.
+            return
+        if node.is_engine:
+            with cache.reloading():
+                node.get_api_info()
+            return
+        with cache.reloading(store=False):
+            entities = node.fetch()
+        with self._cond:
+            if self._stopped:
+                return
+            first = not self._results
+            self._results[node] = (entities, version)
+        if first:
+            self._defer(self._apply)
+
+    def _apply(self):
+        # Called from the main thread, between commands.
+        with self._cond:
+            results = self._results
+            self._results = {}
+        for collection, (entities, version) in results.items():
+            collection.apply_listing(entities, version)
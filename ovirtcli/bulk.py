@@ -0,0 +1,130 @@
+'''
+Implements the concurrent dispatch of ovirt4cli bulk actions.
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may
+not use this file except in compliance with the License. You may obtain
+a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations
+under the License.
+'''
+
+import fnmatch
+import re
+import threading
+
+default_concurrency = 8
+
+# Characters making a name a glob pattern.
+glob_chars = '*?['
+# Prefix of a name that is a regular expression.
+regex_prefix = 're:'
+
+def is_pattern(name):
+    '''
+    Returns whether name is a glob pattern or a regular expression rather
+    than a plain object name.
+    '''
+    return name.startswith(regex_prefix) \
+        or any(char in name for char in glob_chars)
+
+def compile_pattern(pattern):
+    '''
+    Returns a function telling whether a name matches pattern, either a
+    glob pattern or a regular expression prefixed with 're:'. Either one
+    must match the whole name.
+    @raise ValueError: If the regular expression is invalid.
+    '''
+    if pattern.startswith(regex_prefix):
+        try:
+            regex = re.compile('(?:%s)\\Z' % pattern[len(regex_prefix):])
+        except re.error as error:
+            raise ValueError("Invalid regular expression %s: %s"
+                             % (pattern, error))
+    else:
+        regex = re.compile(fnmatch.translate(pattern))
+    return lambda name: regex.match(name) is not None
+
+def run_concurrently(steps, items, concurrency=None):
+    '''
+    Runs steps on each of items, concurrently for up to @concurrency items
+    at a time. A step sends a request with the SDK's wait=False, and
+    returns its future: the requests of a whole window are sent before
+    waiting for any of their responses, so that they are all in flight at
+    once. The connection waits for responses under a lock, which is why
+    this is done from the calling thread rather than from worker threads.
+    Each step is run for all the items before the next one, skipping the
+    items it failed for. Exceptions are caught and returned rather than
+    raised, so that a failure does not hide the outcome of the others.
+
+    @param steps: The functions to call, with an item as only argument,
+    each returning a future such as ovirtsdk4.service.Future or
+    ThreadFuture.
+    @type steps: list of callable
+    @param items: The items to run the steps on.
+    @type items: list
+    @param concurrency: Maximum number of requests in flight.
+    @type concurrency: int or None
+    @return: A list of (item, result, error) tuples in the order of items,
+    result being the result of the last step, and error the exception a
+    step raised, or None.
+    '''
+    if not concurrency:
+        concurrency = default_concurrency
+
+    results = [None] * len(items)
+    errors = [None] * len(items)
+    for step in steps:
+        pending = [index for index in range(len(items))
+                   if errors[index] is None]
+        for start in range(0, len(pending), concurrency):
+            futures = []
+            for index in pending[start:start + concurrency]:
+                try:
+                    futures.append((index, step(items[index])))
+                except Exception as error:
+                    errors[index] = error
+            for index, future in futures:
+                try:
+                    results[index] = future.wait()
+                except Exception as error:
+                    errors[index] = error
+    return [(item, results[index] if errors[index] is None else None,
+             errors[index]) for index, item in enumerate(items)]
+
+
+class ThreadFuture(object):
+    '''
+    Makes a blocking call in a thread of its own, as a future for
+    run_concurrently(), for the SDK methods that drop the future they get
+    with wait=False, such as remove(). The calls of a window then wait for
+    their responses at once, the connection serving them all while any one
+    of them waits.
+    '''
+    def __init__(self, function, *args):
+        self._result = None
+        self._error = None
+        self._thread = threading.Thread(target=self._run,
+                                        args=(function,) + args)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self, function, *args):
+        try:
+            self._result = function(*args)
+        except Exception as error:
+            self._error = error
+
+    def wait(self):
+        '''
+        Returns the result of the call, or raises its exception.
+        '''
+        self._thread.join()
+        if self._error is not None:
+            raise self._error
+        return self._result
@@ -0,0 +1,161 @@
+'''
+Implements the ovirt4cli collection cache.
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may
+not use this file except in compliance with the License. You may obtain
+a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations
+under the License.
+'''
+
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+default_ttl = 60
+default_max_objects = 100000
+
+class CollectionCache(object):
+    '''
+    A per-connection cache of oVirt Engine responses, keyed by the path of
+    the node that fetched them, optionally followed by '?' and a query.
+    Entries expire after ttl seconds, and the least recently used entries
+    are evicted once more than max_objects objects are cached.
+    The cache is shared by the refresh worker threads, hence the lock.
+    '''
+    def __init__(self, ttl=default_ttl, max_objects=default_max_objects):
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._size = 0
+        self.ttl = ttl
+        self.max_objects = max_objects
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def _count(value):
+        if isinstance(value, list):
+            return len(value)
+        return 1
+
+    def configure(self, ttl=None, max_objects=None):
+        '''
+        Changes the cache TTL and size bound, evicting entries as needed.
+        '''
+        with self._lock:
+            if ttl is not None:
+                self.ttl = ttl
+            if max_objects is not None:
+                self.max_objects = max_objects
+            self._evict()
+
+    def lookup(self, key):
+        '''
+        Returns the cached value for key, or None if it is missing or
+        expired, without loading it.
+        '''
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.time() - entry[0] >= self.ttl:
+                return None
+            self.hits += 1
+            return entry[1]
+
+    def get(self, key, loader):
+        '''
+        Returns the cached value for key, calling loader() to fetch it if it
+        is missing or expired. A ttl of 0 disables caching.
+        '''
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and now - entry[0] < self.ttl \
+               and not getattr(self._local, 'reloading', False):
+                self._entries.pop(key)
+                self._entries[key] = entry
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+
+        # Don't hold the lock over the round trip to oVirt Engine.
+        value = loader()
+        if getattr(self._local, 'store', True):
+            self.put(key, value)
+        return value
+
+    @contextmanager
+    def reloading(self, store=True):
+        '''
+        Makes get() call its loader and cache the new value even if the
+        cached one did not expire, from the calling thread and until the
+        end of the block. The auto refresher fetches the engines and
+        collections again this way, see AutoRefresher.
+        @param store: If False, the new values are returned without being
+        cached, for the caller to put() them once it knows they are still
+        current.
+        @type store: bool
+        '''
+        self._local.reloading = True
+        self._local.store = store
+        try:
+            yield
+        finally:
+            self._local.reloading = False
+            self._local.store = True
+
+    def put(self, key, value):
+        '''
+        Stores value for key, for instance after it was updated in place.
+        '''
+        if not self.ttl:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._size -= self._count(self._entries.pop(key)[1])
+            self._entries[key] = (time.time(), value)
+            self._size += self._count(value)
+            self._evict()
+
+    def _evict(self):
+        now = time.time()
+        for key, (stamp, value) in list(self._entries.items()):
+            if now - stamp >= self.ttl:
+                self._size -= self._count(self._entries.pop(key)[1])
+                self.evictions += 1
+        while self._size > self.max_objects and self._entries:
+            key, (stamp, value) = self._entries.popitem(last=False)
+            self._size -= self._count(value)
+            self.evictions += 1
+
+    def flush(self, path='/'):
+        '''
+        Drops the entries fetched from path and below.
+        '''
+        path = path.rstrip('/')
+        with self._lock:
+            for key in list(self._entries.keys()):
+                if not path or key.split('?', 1)[0] == path \
+                   or key.startswith(path + '/'):
+                    self._size -= self._count(self._entries.pop(key)[1])
+
+    def entries(self):
+        '''
+        Returns (key, number of objects, age in seconds) for each entry,
+        least recently used first.
+        '''
+        now = time.time()
+        with self._lock:
+            return [(key, self._count(value), now - stamp)
+                    for key, (stamp, value) in self._entries.items()]
+
+    def __len__(self):
+        return self._size
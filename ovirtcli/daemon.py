@@ -0,0 +1,174 @@
+'''
+Implements the ovirt4cli daemon, which keeps a connected shell and its
+object tree warm between one-shot commands, and its thin client.
+
+Commands are sent over a UNIX socket, one per connection, as a JSON line,
+and answered with the JSON encoded output of the command once it is over.
+The client side only needs the standard library, so that a one-shot
+command costs a socket round trip rather than importing the shell, logging
+in and listing collections.
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may
+not use this file except in compliance with the License. You may obtain
+a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations
+under the License.
+'''
+
+import errno
+import io
+import json
+import os
+import socket
+import time
+
+default_socket = '~/.ovirtcli/daemon.sock'
+
+def _read_all(sock):
+    chunks = []
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            return b''.join(chunks)
+        chunks.append(chunk)
+
+def request(path, cmdline):
+    '''
+    Runs cmdline on the daemon listening at path.
+    @return: A tuple (stdout, stderr, error), error being the message of
+    the exception the command raised, or None if it succeeded.
+    @raise socket.error: If no daemon listens at path.
+    '''
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(os.path.expanduser(path))
+        sock.sendall(json.dumps({'command': cmdline}).encode('utf-8')
+                     + b'\n')
+        sock.shutdown(socket.SHUT_WR)
+        reply = json.loads(_read_all(sock).decode('utf-8'))
+    finally:
+        sock.close()
+    return reply['stdout'], reply['stderr'], reply['error']
+
+
+class Daemon(object):
+    '''
+    Serves the commands sent by clients on a UNIX socket, one at a time,
+    from the calling thread, as the tree is not thread safe.
+    The tree is refreshed before a command once cache_ttl seconds passed
+    since the previous refresh, which with the global incremental_refresh
+    costs a single request to the events feed.
+    @param shell: The shell to run the commands with.
+    @type shell: ConfigShell
+    @param root: The root node of the shell.
+    @type root: UIRoot
+    @param path: The path of the socket to listen on.
+    @type path: str
+    '''
+    def __init__(self, shell, root, path=default_socket):
+        self.shell = shell
+        self.root = root
+        self.path = os.path.expanduser(path)
+        self._refreshed = time.time()
+        self._sock = None
+
+    def listen(self):
+        '''
+        Creates the socket, only accessible to the current user. Fails if
+        another daemon is already listening on it.
+        '''
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except socket.error:
+                # Left over by a daemon that was killed.
+                os.unlink(self.path)
+            else:
+                raise RuntimeError("A daemon is already listening on %s"
+                                   % self.path)
+            finally:
+                probe.close()
+
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        umask = os.umask(0o177)
+        try:
+            self._sock.bind(self.path)
+        finally:
+            os.umask(umask)
+        self._sock.listen(64)
+
+    def serve(self):
+        '''
+        Serves commands until one of them is 'exit'.
+        '''
+        if self._sock is None:
+            self.listen()
+        try:
+            while not self.shell._exit:
+                try:
+                    conn, _ = self._sock.accept()
+                except socket.error as error:
+                    if error.errno == errno.EINTR:
+                        continue
+                    raise
+                try:
+                    self.handle(conn)
+                except socket.error:
+                    # The client went away, there is no one to tell.
+                    pass
+                except Exception as error:
+                    self.shell.log.error("Bad request: %s" % error)
+                finally:
+                    conn.close()
+        finally:
+            self._sock.close()
+            self._sock = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def handle(self, conn):
+        data = _read_all(conn)
+        if not data:
+            # Another daemon checking whether this one is alive.
+            return
+        cmdline = json.loads(data.decode('utf-8'))['command']
+        stdout, stderr, error = self.run(cmdline)
+        conn.sendall(json.dumps({
+            'stdout': stdout,
+            'stderr': stderr,
+            'error': error,
+        }).encode('utf-8'))
+
+    def run(self, cmdline):
+        '''
+        Runs cmdline from the root node like a one-shot command, capturing
+        its output.
+        @return: A tuple (stdout, stderr, error message or None).
+        '''
+        con = self.shell.con
+        saved = con._stdout, con._stderr
+        con._stdout, con._stderr = io.StringIO(), io.StringIO()
+        error = None
+        try:
+            now = time.time()
+            ttl = self.shell.prefs['cache_ttl'] or 0
+            if not self.root.is_connected():
+                self._refreshed = now
+            elif now - self._refreshed >= ttl:
+                self.root.refresh()
+                self._refreshed = now
+            self.shell._current_node = self.root
+            self.shell.run_cmdline(cmdline)
+        except Exception as exception:
+            error = str(exception)
+        finally:
+            stdout, stderr = con._stdout.getvalue(), con._stderr.getvalue()
+            con._stdout, con._stderr = saved
+        return stdout, stderr, error
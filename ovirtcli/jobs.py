@@ -0,0 +1,189 @@
+'''
+Implements tracking of long running oVirt Engine operations.
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may
+not use this file except in compliance with the License. You may obtain
+a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations
+under the License.
+'''
+
+import threading
+import time
+
+from .stats import request_stats
+
+min_poll_interval = 5
+max_poll_interval = 60
+default_timeout = 15 * 60
+
+class Job(object):
+    '''
+    A long running operation, polled in the background by a JobManager.
+    @param description: What the job does, for display.
+    @type description: str
+    @param poll: Called with no arguments on each poll, returns a tuple
+    (done, status), status being a short text describing the progress.
+    @type poll: callable
+    @param on_done: Called with the job once it is over, from the poller
+    thread.
+    @type on_done: callable or None
+    @param timeout: Number of seconds after which the job is given up.
+    @type timeout: int
+    '''
+    def __init__(self, description, poll, on_done=None,
+                 timeout=default_timeout):
+        self.id = None
+        self.description = description
+        self.status = 'submitted'
+        self.error = None
+        self.started = time.time()
+        self.finished = None
+        self._poll = poll
+        self._on_done = on_done
+        self._timeout = timeout
+        self._interval = min_poll_interval
+        self._next_poll = self.started + self._interval
+
+    def is_done(self):
+        return self.finished is not None
+
+    def elapsed(self):
+        return (self.finished or time.time()) - self.started
+
+    def poll(self, now):
+        '''
+        Polls the job, backing off while its status does not change.
+        Returns True if the status changed.
+        '''
+        try:
+            done, status = self._poll()
+        except Exception as error:
+            done, status = True, 'failed'
+            self.error = str(error)
+
+        changed = status != self.status
+        self.status = status
+        if changed:
+            self._interval = min_poll_interval
+        else:
+            self._interval = min(self._interval * 2, max_poll_interval)
+        self._next_poll = now + self._interval
+
+        if not done and now - self.started > self._timeout:
+            done = True
+            self.error = 'timed out after %ds' % self._timeout
+        if done:
+            self.finished = now
+        return changed
+
+
+class JobManager(object):
+    '''
+    Tracks jobs with a single background poller thread, which only runs
+    while there are pending jobs.
+    @param log: The shell log, progress is reported to.
+    '''
+    def __init__(self, log):
+        self._log = log
+        self._jobs = []
+        self._next_id = 1
+        self._cond = threading.Condition()
+        self._thread = None
+        self._stopped = False
+
+    def submit(self, job):
+        '''
+        Starts tracking job, and returns it.
+        '''
+        with self._cond:
+            job.id = self._next_id
+            self._next_id += 1
+            self._jobs.append(job)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='ovirtcli-jobs')
+                self._thread.daemon = True
+                self._thread.start()
+            self._cond.notify_all()
+        return job
+
+    def jobs(self):
+        with self._cond:
+            return list(self._jobs)
+
+    def get(self, job_id):
+        for job in self.jobs():
+            if job.id == job_id:
+                return job
+        return None
+
+    def clear(self):
+        '''
+        Forgets the jobs that are over.
+        '''
+        with self._cond:
+            self._jobs = [job for job in self._jobs if not job.is_done()]
+
+    def wait(self, jobs=None, timeout=None):
+        '''
+        Blocks until jobs (all pending jobs by default) are over, or until
+        timeout seconds elapsed. Returns True if they are all over.
+        '''
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+        with self._cond:
+            if jobs is None:
+                jobs = list(self._jobs)
+            while not all(job.is_done() for job in jobs):
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return False
+                # Wake up regularly so that KeyboardInterrupt gets through.
+                self._cond.wait(min(remaining or 1, 1))
+        return True
+
+    def stop(self):
+        with self._cond:
+            self._stopped = True
+            self._cond.notify_all()
+
+    def _run(self):
+        request_stats.set_thread_origin('jobs')
+        while True:
+            with self._cond:
+                pending = [job for job in self._jobs if not job.is_done()]
+                if self._stopped or not pending:
+                    self._thread = None
+                    return
+                delay = min(job._next_poll for job in pending) - time.time()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+
+            now = time.time()
+            for job in pending:
+                if job._next_poll > now:
+                    continue
+                if job.poll(now):
+                    self._log.info("Job %d (%s): %s"
+                                   % (job.id, job.description, job.status))
+                if job.is_done():
+                    if job.error:
+                        self._log.info("Job %d (%s) failed: %s"
+                                       % (job.id, job.description,
+                                          job.error))
+                    if job._on_done is not None:
+                        job._on_done(job)
+
+            with self._cond:
+                self._cond.notify_all()
@@ -0,0 +1,83 @@
+'''
+Implements the ovirt4cli machine readable output formats.
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may
+not use this file except in compliance with the License. You may obtain
+a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations
+under the License.
+'''
+
+import csv
+import json
+import re
+
+# 'text' is the rendered tree, the others stream one record per node.
+output_formats = ('text', 'json', 'csv')
+# The CSV columns, JSON records also having the fields of the objects.
+csv_columns = ('path', 'kind', 'name', 'id', 'summary', 'healthy')
+# Records written between two flushes of the output, about a page.
+flush_every = 500
+
+def sort_key(node):
+    '''
+    Orders sibling nodes as the rendered tree does, names ending with a
+    number numerically, e.g. "vm2" before "vm10".
+    '''
+    match = re.search(r'(.*?)(\d+$)', node.name)
+    if match:
+        return (match.group(1), int(match.group(2)))
+    return (node.name, 0)
+
+
+class RecordWriter(object):
+    '''
+    Writes records one at a time, as JSON lines or as CSV rows after a
+    header line, so that the output starts with the first record and does
+    not grow in memory with their number.
+    @param stream: The output, a text file.
+    @param output_format: 'json' or 'csv', see output_formats.
+    @type output_format: str
+    '''
+    def __init__(self, stream, output_format):
+        self._stream = stream
+        self._csv = None
+        self._pending = 0
+        if output_format == 'csv':
+            self._csv = csv.writer(stream, lineterminator='\n')
+            self._csv.writerow(csv_columns)
+
+    def write(self, record):
+        '''
+        Writes a record, a dict, flushing the output every flush_every
+        records.
+        '''
+        if self._csv is not None:
+            self._csv.writerow([record.get(column) for column in csv_columns])
+        else:
+            self._stream.write(json.dumps(record, separators=(',', ':'))
+                               + '\n')
+        self._pending += 1
+        if self._pending >= flush_every:
+            self.flush()
+
+    def write_all(self, records):
+        '''
+        Writes each of records as soon as it is yielded, then flushes the
+        output.
+        '''
+        try:
+            for record in records:
+                self.write(record)
+        finally:
+            self.flush()
+
+    def flush(self):
+        self._pending = 0
+        self._stream.flush()
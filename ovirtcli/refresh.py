@@ -0,0 +1,100 @@
+'''
+Implements concurrent refresh of the ovirt4cli objects tree.
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may
+not use this file except in compliance with the License. You may obtain
+a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations
+under the License.
+'''
+
+default_concurrency = 8
+
+def refresh_nodes(nodes, concurrency=None):
+    '''
+    Refreshes a set of nodes.
+    Nodes having a fetch() method (collections) get their collection listed
+    concurrently over a pool of at most @concurrency worker threads, so a
+    refresh costs about one round trip to oVirt Engine rather than one per
+    collection. The fetched objects are then handed to each node's refresh()
+    from the calling thread, so the tree itself is only ever modified there.
+    Other nodes are refreshed serially.
+
+    @param nodes: The nodes to refresh.
+    @type nodes: iterable of UINode
+    @param concurrency: Maximum number of parallel fetches, 1 to disable.
+    @type concurrency: int or None
+    '''
+    if not concurrency:
+        concurrency = default_concurrency
+
+    collections = []
+    others = []
+    for node in nodes:
+        if getattr(node, 'fetch', None) is not None:
+            collections.append(node)
+        else:
+            others.append(node)
+
+    if concurrency > 1 and len(collections) > 1:
+        from concurrent.futures import ThreadPoolExecutor
+        pool = ThreadPoolExecutor(max_workers=min(concurrency,
+                                                  len(collections)))
+        try:
+            futures = [(node, pool.submit(node.fetch))
+                       for node in collections]
+            for node, future in futures:
+                node.refresh(future.result())
+        finally:
+            pool.shutdown(wait=True)
+    else:
+        for node in collections:
+            node.refresh()
+
+    for node in others:
+        node.refresh()
+
+def map_concurrently(function, items, concurrency=None):
+    '''
+    Calls function on each of items over a pool of at most @concurrency
+    worker threads, such as to query several engines at once, each over its
+    own connection. The first exception raised is raised again.
+
+    @param function: The function to call, with an item as only argument.
+    @type function: callable
+    @param items: The items to call function on.
+    @type items: list
+    @param concurrency: Maximum number of parallel calls, 1 to disable.
+    @type concurrency: int or None
+    @return: The list of the results, in the order of items.
+    '''
+    if not concurrency:
+        concurrency = default_concurrency
+
+    if concurrency == 1 or len(items) < 2:
+        return [function(item) for item in items]
+
+    from concurrent.futures import ThreadPoolExecutor
+    pool = ThreadPoolExecutor(max_workers=min(concurrency, len(items)))
+    try:
+        futures = [pool.submit(function, item) for item in items]
+        return [future.result() for future in futures]
+    finally:
+        pool.shutdown(wait=True)
+
+def interleave(lists):
+    '''
+    Merges lists round-robin, so that a pool working through the result
+    spreads its first requests over all of them, such as over the
+    collections of several engines.
+    '''
+    merged = []
+    for index in range(max([len(items) for items in lists] or [0])):
+        merged.extend(items[index] for items in lists if index < len(items))
+    return merged
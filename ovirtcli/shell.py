@@ -0,0 +1,50 @@
+'''
+Implements the oVirtCLI configuration shell.
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may
+not use this file except in compliance with the License. You may obtain
+a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations
+under the License.
+'''
+
+from configshell_fb import ConfigShell
+
+class oVirtCLI(ConfigShell):
+    default_prefs = {'color_path': 'magenta',
+                     'color_command': 'cyan',
+                     'color_parameter': 'magenta',
+                     'color_keyword': 'cyan',
+                     'completions_in_columns': True,
+                     'logfile': None,
+                     'loglevel_console': 'info',
+                     'loglevel_file': 'debug9',
+                     'color_mode': True,
+                     'prompt_length': 30,
+                     'tree_max_depth': 0,
+                     'tree_status_mode': True,
+                     'tree_round_nodes': True,
+                     'tree_show_root': True,
+                     'auto_cd_after_create': False,
+                     'auto_save_on_exit': True,
+                     'lazy_refresh': True,
+                     'refresh_concurrency': 8,
+                     'cache_ttl': 60,
+                     'cache_max_objects': 100000,
+                     'incremental_refresh': False,
+                     'page_size': 500,
+                     'token_cache': True,
+                     'token_ttl': 1800,
+                     'trust_cached_token': False,
+                     'bulk_concurrency': 8,
+                     'connections': 16,
+                     'pipeline': 0,
+                     'auto_refresh': 0,
+                     'output_format': 'text',
+                    }
@@ -0,0 +1,229 @@
+'''
+Implements the ovirt4cli inventory snapshot files.
+
+A snapshot is a JSON lines file, gzip compressed if its name ends with
+'.gz'. Its first line is a header, followed for each collection by a line
+describing it, then one line per object: the JSON array of the values of
+its record, sorted by id so that two snapshots can be compared in a single
+pass. Enums and other SDK types are saved as their value, or as an object
+of their plain attributes, and their type names listed in the collection
+line.
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may
+not use this file except in compliance with the License. You may obtain
+a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations
+under the License.
+'''
+
+import gzip
+import io
+import json
+import os
+from enum import Enum
+
+format_version = 1
+plain_types = (str, int, float, bool)
+
+def open_snapshot(path, mode='r', compressed=None):
+    '''
+    Opens a snapshot file for reading or writing text, compressed if its
+    name ends with '.gz', unless compressed is given.
+    '''
+    if compressed is None:
+        compressed = path.endswith('.gz')
+    if compressed:
+        # Favor speed over size, the default level being much slower.
+        return gzip.open(path, mode + 't', compresslevel=6, encoding='utf-8')
+    return io.open(path, mode, encoding='utf-8')
+
+def encode(value):
+    '''
+    Returns the JSON representation of an attribute value.
+    '''
+    if value is None or isinstance(value, plain_types):
+        return value
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, list):
+        return [encode(item) for item in value]
+    # SDK structs, only keeping their plain attributes.
+    return dict((name.lstrip('_'), attr) for name, attr in vars(value).items()
+                if isinstance(attr, plain_types))
+
+def decoder(type_name):
+    '''
+    Returns the function turning the JSON representation of a value of
+    the given SDK type back into the value.
+    '''
+    import ovirtsdk4.types as types
+    value_type = getattr(types, type_name, None)
+    if value_type is None:
+        raise ValueError("Unknown type %s" % type_name)
+    if issubclass(value_type, Enum):
+        return value_type
+    return lambda attrs: value_type(**attrs)
+
+def value_types(fields, records):
+    '''
+    Returns the names of the SDK types of the fields of records, by field,
+    for the fields that are not plain values.
+    '''
+    types = {}
+    for index, field in enumerate(fields):
+        for record in records:
+            value = record[index]
+            if value is not None:
+                if not isinstance(value, plain_types + (list,)):
+                    types[field] = type(value).__name__
+                break
+    return types
+
+def write_snapshot(path, header, collections):
+    '''
+    Writes a snapshot file, replacing it once complete.
+
+    @param path: The file to write.
+    @type path: str
+    @param header: Information on the snapshot, such as the engines.
+    @type header: dict
+    @param collections: The collections to save, as (path, type name,
+    records) tuples, records being named tuples whose first field is id.
+    @type collections: iterable of tuple
+    @return: The number of objects written.
+    '''
+    written = 0
+    temporary = '%s.tmp' % path
+    with open_snapshot(temporary, 'w', path.endswith('.gz')) as out:
+        out.write(json.dumps(dict(header, snapshot=format_version)) + '\n')
+        for collection, type_name, records in collections:
+            records = sorted(records, key=lambda record: record.id)
+            fields = list(records[0]._fields) if records else ['id']
+            out.write(json.dumps({
+                'collection': collection,
+                'type': type_name,
+                'fields': fields,
+                'types': value_types(fields, records),
+                'count': len(records),
+            }) + '\n')
+            for record in records:
+                out.write(json.dumps([encode(value) for value in record],
+                                     separators=(',', ':')) + '\n')
+            written += len(records)
+    os.rename(temporary, path)
+    return written
+
+
+class SnapshotReader(object):
+    '''
+    Reads a snapshot file one collection at a time.
+    @param path: The file to read.
+    @type path: str
+    @param decode: Whether to turn the values of SDK types back into
+    them, rather than keeping their JSON representation, see encode().
+    @type decode: bool
+    @raise ValueError: If the file is not a snapshot.
+    '''
+    def __init__(self, path, decode=True):
+        self._decode = decode
+        self._file = open_snapshot(path)
+        try:
+            self.header = json.loads(self._file.readline() or 'null')
+        except ValueError:
+            self.header = None
+        if not isinstance(self.header, dict) \
+           or self.header.get('snapshot') != format_version:
+            self._file.close()
+            raise ValueError("%s is not an ovirtcli snapshot" % path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._file.close()
+
+    def collections(self):
+        '''
+        Yields each collection as a (description, rows) tuple, rows
+        yielding the values of its objects, sorted by id, as lists. The rows
+        of a collection are skipped if not read before the next one.
+        '''
+        rows = None
+        while True:
+            if rows is not None:
+                for _ in rows:
+                    pass
+            line = self._file.readline()
+            if not line:
+                return
+            description = json.loads(line)
+            rows = self._rows(description)
+            yield description, rows
+
+    def _rows(self, description):
+        decoders = []
+        if self._decode:
+            decoders = [(description['fields'].index(field),
+                         decoder(type_name))
+                        for field, type_name in description['types'].items()]
+        for _ in range(description['count']):
+            row = json.loads(self._file.readline())
+            for index, decode in decoders:
+                if row[index] is not None:
+                    row[index] = decode(row[index])
+            yield row
+
+
+def merge_by_key(old, new, key):
+    '''
+    Joins two iterables sorted by key, such as the collections or the rows
+    of two snapshots, reading each of them once.
+    @return: A generator of (old item, new item) pairs, in key order, either
+    item being None if the other iterable has none with the same key.
+    '''
+    old = iter(old)
+    new = iter(new)
+    old_item = next(old, None)
+    new_item = next(new, None)
+    while old_item is not None or new_item is not None:
+        if new_item is None \
+           or old_item is not None and key(old_item) < key(new_item):
+            yield old_item, None
+            old_item = next(old, None)
+        elif old_item is None or key(new_item) < key(old_item):
+            yield None, new_item
+            new_item = next(new, None)
+        else:
+            yield old_item, new_item
+            old_item = next(old, None)
+            new_item = next(new, None)
+
+def diff_rows(old_fields, old_rows, new_fields, new_rows):
+    '''
+    Compares the rows of a collection in two snapshots, both sorted by id.
+    Only the fields both have are compared.
+    @return: A generator of (old row, new row, changes) tuples for the
+    objects that were added, with no old row, removed, with no new row,
+    or changed, changes being a list of (field, old value, new value).
+    '''
+    common = [(field, old_fields.index(field), new_fields.index(field))
+              for field in old_fields[1:] if field in new_fields]
+    for old_row, new_row in merge_by_key(old_rows, new_rows,
+                                         lambda row: row[0]):
+        if old_row is None or new_row is None:
+            yield old_row, new_row, None
+            continue
+        changes = [(field, old_row[old_index], new_row[new_index])
+                   for field, old_index, new_index in common
+                   if old_row[old_index] != new_row[new_index]]
+        if changes:
+            yield old_row, new_row, changes
@@ -0,0 +1,259 @@
+'''
+Implements the instrumentation of the requests sent to oVirt Engine.
+
+Every SDK call, be it a list(), a get() or an action, ends up in the
+connection's send() and wait() methods, so the connection is instrumented
+rather than each service call. The SSO login is not sent through them,
+and is accounted by login() around the connection's public
+authenticate() instead.
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may
+not use this file except in compliance with the License. You may obtain
+a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations
+under the License.
+'''
+
+import threading
+import time
+
+# Upper bounds of the latency histogram buckets, in milliseconds.
+latency_buckets = (10, 50, 100, 500, 1000, 5000)
+
+def resource_of(method, path):
+    '''
+    Returns the resource a request is accounted to: its method and path,
+    with the object id replaced by '*', such as 'GET /hosts/*'.
+    '''
+    segments = [segment for segment in path.split('?', 1)[0].split('/')
+                if segment]
+    if len(segments) > 1:
+        segments[1] = '*'
+    return '%s /%s' % (method, '/'.join(segments))
+
+
+class ResourceStats(object):
+    '''
+    The counters of the requests sent to one resource.
+    '''
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.bytes = 0
+        self.histogram = [0] * (len(latency_buckets) + 1)
+
+    def record(self, latency, size, failed):
+        self.count += 1
+        self.errors += int(failed)
+        self.total += latency
+        self.max = max(self.max, latency)
+        self.bytes += size
+        bucket = 0
+        while bucket < len(latency_buckets) \
+                and latency * 1000 >= latency_buckets[bucket]:
+            bucket += 1
+        self.histogram[bucket] += 1
+
+
+class OriginStats(object):
+    '''
+    The counters of the requests sent on behalf of one UI command, counting
+    how many of them were for an URL already requested by the same command.
+    '''
+    def __init__(self):
+        self.runs = 0
+        self.count = 0
+        self.redundant = 0
+        self.total = 0.0
+        self._seen = set()
+
+    def start(self):
+        self.runs += 1
+        self._seen = set()
+
+    def record(self, url, latency):
+        self.count += 1
+        self.total += latency
+        if url in self._seen:
+            self.redundant += 1
+        self._seen.add(url)
+
+
+class RequestStats(object):
+    '''
+    Accounts the requests sent to oVirt Engine, per resource and per the UI
+    command they were sent for, optionally tracing each one to a file.
+    Requests are sent from refresh worker threads too, hence the lock.
+    '''
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pending = {}
+        self._trace = None
+        self.command = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._resources = {}
+            self._origins = {}
+            if self.command is not None:
+                self._origins[self.command] = OriginStats()
+                self._origins[self.command].start()
+
+    def start_command(self, command):
+        '''
+        Accounts the following requests to command, including the ones sent
+        from worker threads on its behalf.
+        '''
+        with self._lock:
+            self.command = command
+            self._origins.setdefault(command, OriginStats()).start()
+
+    def set_thread_origin(self, origin):
+        '''
+        Accounts the requests sent from the calling thread to origin rather
+        than to the current command, for background threads.
+        '''
+        self._local.origin = origin
+        with self._lock:
+            self._origins.setdefault(origin, OriginStats())
+
+    def trace(self, path):
+        '''
+        Appends a line per request to the file at path, or stops tracing if
+        path is None.
+        '''
+        with self._lock:
+            if self._trace is not None:
+                self._trace.close()
+                self._trace = None
+            if path is not None:
+                self._trace = open(path, 'a')
+
+    def tracing(self):
+        return self._trace is not None and self._trace.name
+
+    def started(self, context, request):
+        url = request.path or '/'
+        if request.query:
+            url += '?' + '&'.join('%s=%s' % item
+                                  for item in sorted(request.query.items()))
+        origin = getattr(self._local, 'origin', None) or self.command
+        with self._lock:
+            self._pending[id(context)] = (time.time(), request.method, url,
+                                          origin)
+
+    def finished(self, context, response=None, error=None):
+        now = time.time()
+        with self._lock:
+            pending = self._pending.pop(id(context), None)
+            if pending is None:
+                return
+            start, method, url, origin = pending
+            self._record(start, now, method, url, origin, response, error)
+
+    def login(self, start, error=None):
+        '''
+        Accounts an SSO login that started at start.
+        '''
+        origin = getattr(self._local, 'origin', None) or self.command
+        with self._lock:
+            self._record(start, time.time(), 'POST', '/sso', origin,
+                         None, error)
+
+    def _record(self, start, now, method, url, origin, response, error):
+        latency = now - start
+        size = len(response.body or b'') if response is not None else 0
+        failed = error is not None or \
+            (response is not None and response.code >= 400)
+        self._resources.setdefault(resource_of(method, url),
+                                   ResourceStats()).record(latency, size,
+                                                           failed)
+        if origin is not None:
+            self._origins.setdefault(origin, OriginStats()).record(
+                '%s %s' % (method, url), latency)
+        if self._trace is not None:
+            if error is not None:
+                status = 'error: %s' % error
+            else:
+                status = response.code if response is not None else '-'
+            self._trace.write('%s %8.1fms %s %s %s %s [%s]\n' % (
+                time.strftime('%H:%M:%S', time.localtime(start)),
+                latency * 1000, method, url, status, size, origin or '-'))
+            self._trace.flush()
+
+    def resources(self):
+        '''
+        Returns (resource, ResourceStats) tuples, sorted by resource.
+        '''
+        with self._lock:
+            return sorted(self._resources.items())
+
+    def origins(self):
+        '''
+        Returns (command, OriginStats) tuples for the commands that sent
+        requests, most requests first.
+        '''
+        with self._lock:
+            return sorted([item for item in self._origins.items()
+                           if item[1].count],
+                          key=lambda item: -item[1].count)
+
+request_stats = RequestStats()
+
+def instrument(connection, stats=request_stats):
+    '''
+    Makes connection account the requests it sends to stats. Connections
+    without send() and wait() methods are left as they are.
+    @param connection: The SDK connection to instrument.
+    @type connection: ovirtsdk4.Connection
+    '''
+    send = getattr(connection, 'send', None)
+    wait = getattr(connection, 'wait', None)
+    if send is None or wait is None:
+        return connection
+
+    def timed_send(request):
+        context = send(request)
+        stats.started(context, request)
+        return context
+
+    def timed_wait(context, *args, **kwargs):
+        try:
+            response = wait(context, *args, **kwargs)
+        except Exception as error:
+            stats.finished(context, error=error)
+            raise
+        stats.finished(context, response)
+        return response
+
+    connection.send = timed_send
+    connection.wait = timed_wait
+    return connection
+
+def login(connection, stats=request_stats):
+    '''
+    Logs in to oVirt Engine with the connection's authenticate(), accounting
+    the SSO login to stats. The logins the SDK does by itself, once a token
+    expired, are not accounted.
+    @param connection: The SDK connection, without a token yet.
+    @type connection: ovirtsdk4.Connection
+    @return: Whether the login succeeded.
+    '''
+    start = time.time()
+    try:
+        connection.authenticate()
+    except Exception as error:
+        stats.login(start, error)
+        return False
+    stats.login(start)
+    return True
@@ -0,0 +1,100 @@
+'''
+Implements the ovirt4cli SSO token cache.
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may
+not use this file except in compliance with the License. You may obtain
+a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations
+under the License.
+'''
+
+import json
+import os
+import time
+
+# oVirt Engine expires SSO tokens after 30 minutes of inactivity by default.
+default_token_ttl = 30 * 60
+token_file = 'tokens.json'
+
+class TokenCache(object):
+    '''
+    Keeps the SSO tokens of oVirt Engine connections in a file only
+    readable by its owner, so that later invocations can reuse them instead
+    of logging in again. Tokens are keyed by engine and user, and are
+    forgotten ttl seconds after they were last used.
+    @param path: The file the tokens are kept in.
+    @type path: str
+    @param ttl: Number of seconds tokens are considered valid for.
+    @type ttl: int
+    '''
+    def __init__(self, path, ttl=default_token_ttl):
+        self.path = path
+        self.ttl = ttl
+
+    @staticmethod
+    def _key(engine, username):
+        return '%s@%s' % (username, engine)
+
+    def _load(self):
+        try:
+            with open(self.path) as tokens_file:
+                tokens = json.load(tokens_file)
+        except (IOError, OSError, ValueError):
+            return {}
+        if not isinstance(tokens, dict):
+            return {}
+        now = time.time()
+        return dict((key, entry) for key, entry in tokens.items()
+                    if isinstance(entry, dict)
+                    and entry.get('expires', 0) > now)
+
+    def _save(self, tokens):
+        # Write to a file created with restricted permissions, then move it
+        # in place, so that the tokens are never readable by others, and
+        # concurrent invocations never see a partial file.
+        tmp_path = '%s.%d' % (self.path, os.getpid())
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        try:
+            with os.fdopen(fd, 'w') as tokens_file:
+                json.dump(tokens, tokens_file, indent=2, sort_keys=True)
+            os.rename(tmp_path, self.path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def get(self, engine, username):
+        '''
+        Returns the cached token of username on engine, or None if there is
+        none or it expired.
+        '''
+        entry = self._load().get(self._key(engine, username))
+        if entry is None:
+            return None
+        return entry.get('token')
+
+    def put(self, engine, username, token):
+        '''
+        Stores the token of username on engine, valid for ttl seconds from
+        now.
+        '''
+        tokens = self._load()
+        tokens[self._key(engine, username)] = {
+            'token': token,
+            'expires': time.time() + self.ttl,
+        }
+        self._save(tokens)
+
+    def drop(self, engine, username):
+        '''
+        Forgets the token of username on engine.
+        '''
+        tokens = self._load()
+        if tokens.pop(self._key(engine, username), None) is not None:
+            self._save(tokens)
@@ -0,0 +1,235 @@
+'''
+Implements the ovirt4cli monitor of host and VM statistics.
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may
+not use this file except in compliance with the License. You may obtain
+a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations
+under the License.
+'''
+
+import time
+from collections import namedtuple
+
+from configshell_fb import ExecutionError
+
+default_interval = 5
+# Shortest interval between polls, in seconds.
+min_interval = 1
+default_rows = 20
+sort_keys = ('cpu', 'memory', 'network', 'name')
+# Moves the cursor to the top left corner of the terminal and clears it.
+clear_screen = '\x1b[H\x1b[2J'
+
+# What the monitor shows of an object: its CPU and memory use in percent,
+# and its network throughput in bytes per second, None if unknown.
+Sample = namedtuple('Sample', ('cpu', 'memory', 'network'))
+
+def stat_values(statistics):
+    '''
+    Returns the current value of each of statistics, by name.
+    '''
+    values = {}
+    for statistic in statistics or []:
+        if statistic.values:
+            values[statistic.name] = statistic.values[0].datum
+    return values
+
+def cpu_percent(values):
+    # VMs report their total use, hosts their idle time.
+    if values.get('cpu.current.total') is not None:
+        return values['cpu.current.total']
+    if values.get('cpu.current.idle') is not None:
+        return 100 - values['cpu.current.idle']
+    return None
+
+def memory_percent(values):
+    used = values.get('memory.used')
+    total = values.get('memory.installed') or values.get('memory.total')
+    if used is None or not total:
+        return None
+    return 100.0 * used / total
+
+def nic_totals(nics):
+    '''
+    Returns the number of bytes received and sent by nics so far, and
+    their current throughput in bytes per second as they report it, either
+    being None if not reported.
+    '''
+    total = rate = None
+    for nic in nics or []:
+        values = stat_values(nic.statistics)
+        for direction in ('rx', 'tx'):
+            count = values.get('data.total.%s' % direction)
+            if count is not None:
+                total = (total or 0) + count
+            bps = values.get('data.current.%s.bps' % direction)
+            if bps is not None:
+                rate = (rate or 0) + bps / 8
+    return total, rate
+
+def human_rate(rate):
+    if rate is None:
+        return '-'
+    for unit in ('B/s', 'KiB/s', 'MiB/s', 'GiB/s'):
+        if rate < 1024:
+            return '%.1f%s' % (rate, unit)
+        rate /= 1024.0
+    return '%.1fTiB/s' % rate
+
+def percent(value):
+    if value is None:
+        return '-'
+    return '%.1f' % value
+
+
+class Monitor(object):
+    '''
+    Turns the statistics polled from objects into samples. The network
+    throughput of an object is the delta of its NICs' byte counters since
+    its previous poll, as it is exact over the whole interval, rather than
+    the instant rate the NICs report, which is only used on the first poll.
+    '''
+    def __init__(self):
+        self._counters = {}
+
+    def sample(self, entity_id, statistics, nics, now):
+        '''
+        Returns the Sample of an object, given its statistics and its NICs
+        with theirs, polled at time now.
+        '''
+        values = stat_values(statistics)
+        total, network = nic_totals(nics)
+        previous = self._counters.get(entity_id)
+        if total is not None:
+            if previous is not None and now > previous[0] \
+               and total >= previous[1]:
+                network = (total - previous[1]) / (now - previous[0])
+            self._counters[entity_id] = (now, total)
+        return Sample(cpu_percent(values), memory_percent(values), network)
+
+    def forget(self, entity_ids):
+        '''
+        Drops the counters of the objects not in entity_ids, no longer
+        polled.
+        '''
+        for entity_id in list(self._counters.keys()):
+            if entity_id not in entity_ids:
+                del self._counters[entity_id]
+
+
+def top_rows(rows, sort, count):
+    '''
+    Returns the count first of rows, (name, Sample) tuples, sorted by the
+    given key of sort_keys, highest first, or by name.
+    '''
+    if sort == 'name':
+        return sorted(rows)[:count]
+    index = Sample._fields.index(sort)
+    return sorted(rows, key=lambda row: (row[1][index] is None,
+                                         -(row[1][index] or 0),
+                                         row[0]))[:count]
+
+def render(title, rows):
+    '''
+    Returns the table of rows, (name, Sample) tuples, under title.
+    '''
+    width = max([len(name) for name, sample in rows] + [4])
+    lines = [title, '%-*s %7s %7s %12s' % (width, 'NAME', 'CPU%', 'MEM%',
+                                           'NET')]
+    for name, sample in rows:
+        lines.append('%-*s %7s %7s %12s'
+                     % (width, name, percent(sample.cpu),
+                        percent(sample.memory), human_rate(sample.network)))
+    return '\n'.join(lines)
+
+def wait_next(start, interval):
+    '''
+    Sleeps until interval seconds after start. A poll longer than the
+    interval is followed by the next one right away rather than queued.
+    '''
+    delay = start + interval - time.time()
+    if delay > 0:
+        time.sleep(delay)
+
+def run_top(collection, names, interval, sort, rows, iterations, service,
+            is_up):
+    '''
+    Polls the statistics and the NICs of the objects of collection
+    selected by names that are up, with fetch_details(), every interval
+    seconds, and displays the rows first by sort, redrawn in place on a
+    terminal. Runs iterations times, or until interrupted if 0. The
+    parameters are the ones of the top commands, as typed.
+    @param collection: The UICollection of the objects.
+    @param service: Returns the service of an object.
+    @type service: callable
+    @param is_up: Tells whether an object has statistics to poll.
+    @type is_up: callable
+    @raise ExecutionError: If a parameter is invalid.
+    '''
+    interval = collection.ui_eval_param(interval, 'number', default_interval)
+    if interval < min_interval:
+        raise ExecutionError("The interval must be at least %d second."
+                             % min_interval)
+    rows = collection.ui_eval_param(rows, 'number', default_rows)
+    if sort not in sort_keys:
+        raise ExecutionError("Unknown sort key %s, expected one of %s"
+                             % (sort, ', '.join(sort_keys)))
+    con = collection.shell.con
+    interactive = con._stdout.isatty()
+    if iterations is None:
+        iterations = 0 if interactive else 1
+    else:
+        iterations = collection.ui_eval_param(iterations, 'number', 1)
+
+    def request(item):
+        entity, kind = item
+        if kind == 'statistics':
+            return service(entity).statistics_service().list(wait=False)
+        return service(entity).nics_service().list(follow='statistics',
+                                                   wait=False)
+
+    entities = collection.select(names,
+                                 'No %s matching %%s.' % collection.name)
+    monitor = Monitor()
+    polls = 0
+    try:
+        while True:
+            start = time.time()
+            polled = [entity for entity in entities if is_up(entity)]
+            items = [(entity, kind) for entity in polled
+                     for kind in ('statistics', 'nics')]
+            results = {}
+            failed = set()
+            for (entity, kind), result, error \
+                    in collection.fetch_details(items, request):
+                if error is not None:
+                    failed.add(entity.id)
+                results[entity.id, kind] = result
+            now = time.time()
+            monitor.forget(set(entity.id for entity in polled))
+            samples = [(entity.name,
+                        monitor.sample(entity.id,
+                                       results[entity.id, 'statistics'],
+                                       results[entity.id, 'nics'], now))
+                       for entity in polled]
+            title = '%s at %s: %d of %d up, polled in %.2fs, every %ds' \
+                    % (collection.name, time.strftime('%H:%M:%S'),
+                       len(polled), len(entities), now - start, interval)
+            if failed:
+                title += ', %d failed' % len(failed)
+            if interactive:
+                con.raw_write(clear_screen, output=con._stdout)
+            con.display(render(title, top_rows(samples, sort, rows)))
+            polls += 1
+            if iterations and polls >= iterations:
+                break
+            wait_next(start, interval)
+    except KeyboardInterrupt:
+        con.display('')
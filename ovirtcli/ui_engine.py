@@ -0,0 +1,406 @@
+'''
+Implements the ovirt4cli oVirt Engine connection UI.
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may
+not use this file except in compliance with the License. You may obtain
+a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations
+under the License.
+'''
+
+import os
+
+from configshell_fb import ExecutionError
+
+from .cache import CollectionCache, default_ttl, default_max_objects
+from .refresh import default_concurrency, interleave, map_concurrently, \
+    refresh_nodes
+from .stats import instrument, login
+from .tokens import TokenCache, default_token_ttl, token_file
+from .ui_node import UINode
+
+def ui_ovirtcli():
+    '''
+    Imports and returns the module of the collection UIs.
+    '''
+    from . import ui_ovirtcli
+    return ui_ovirtcli
+
+
+class UIEngine(UINode):
+    '''
+    A connection to oVirt Engine, and the collections of its objects.
+    The root node is the default connection, and further ones, connected
+    with a name, are its children: see UIRoot. Each one has its own
+    collection cache and events cursor.
+    Refreshing is split in poll(), which only sends requests and may run in
+    a worker thread, and rebuild(), which updates the tree, so that several
+    engines are polled at once.
+    '''
+    is_engine = True
+
+    def __init__(self, name, parent=None, shell=None):
+        UINode.__init__(self, name, parent, shell)
+        self._api = None
+        self._ip = None
+        self._cache = None
+        self._last_event_id = None
+        self._changes = {}
+        self._username = None
+        self._tokens = None
+
+    def get_collections(self):
+        '''
+        Returns the collection nodes of this engine.
+        '''
+        return [child for child in self._children if not child.is_engine]
+
+    def find_collection(self, name):
+        '''
+        Returns the collection node of this engine with the given name, or
+        None.
+        '''
+        for collection in self.get_collections():
+            if collection.name == name:
+                return collection
+        return None
+
+    def get_engines(self):
+        '''
+        Returns the engines listed under this node.
+        '''
+        return [self]
+
+    def fetch_concurrency(self, engines):
+        '''
+        Returns how many collections to fetch in parallel from engines.
+        '''
+        concurrency = self.shell.prefs['refresh_concurrency'] \
+                      or default_concurrency
+        return concurrency * max(len(engines), 1)
+
+    def request_window(self):
+        '''
+        Returns how many requests to send to the engine before waiting for
+        their responses: as many as the global 'connections', each one
+        pipelining the global 'pipeline' requests, can carry at once.
+        '''
+        connections = self.shell.prefs['connections'] or default_concurrency
+        return connections * max(self.shell.prefs['pipeline'] or 0, 1)
+
+    def prefetch(self):
+        '''
+        Fetches what listing the whole tree of the engines would fetch one
+        request at a time: their API entry points, then the collections
+        not loaded yet, concurrently, alternating engines.
+        '''
+        engines = [engine for engine in self.get_engines()
+                   if engine._api is not None]
+        map_concurrently(lambda engine: engine.get_api_info(), engines,
+                         len(engines))
+        stale = interleave([[collection
+                             for collection in engine.get_collections()
+                             if collection.is_stale()]
+                            for engine in engines])
+        refresh_nodes(stale, self.fetch_concurrency(engines))
+
+    def poll(self):
+        '''
+        Reads the changes of the engine objects since the last refresh,
+        without touching the tree.
+        Returns whether the collections can be updated incrementally.
+        '''
+        if self._cache is not None:
+            self._cache.configure(*self._cache_prefs())
+        return self._api is not None and bool(self.get_collections()) \
+            and bool(self.shell.prefs['incremental_refresh']) \
+            and self.poll_events()
+
+    def rebuild(self, incremental):
+        '''
+        Applies the changes read by poll() to the collections if
+        incremental, or recreates them.
+        Returns the collections to fetch.
+        '''
+        if incremental:
+            for collection in self.get_collections():
+                if collection.is_populated():
+                    collection.apply_changes(
+                        self.take_changes(collection.event_attr))
+            return []
+
+        self._children = set([child for child in self._children
+                              if child.is_engine])
+        if self._api is None:
+            return []
+
+        ui = ui_ovirtcli()
+        ui.UIData_centers(self, self._api)
+        ui.UIClusters(self, self._api)
+        ui.UIHosts(self, self._api)
+        ui.UIStorage_domains(self, self._api)
+        ui.UITemplates(self, self._api)
+        ui.UIVMs(self, self._api)
+        return self.get_collections()
+
+    def refresh(self):
+        '''
+        Refreshes the tree of oVirt modules.
+        '''
+        collections = self.rebuild(self.poll())
+        if collections and not self.shell.prefs['lazy_refresh']:
+            refresh_nodes(collections,
+                          self.shell.prefs['refresh_concurrency'])
+
+    def _cache_prefs(self):
+        ttl = self.shell.prefs['cache_ttl']
+        max_objects = self.shell.prefs['cache_max_objects']
+        if ttl is None:
+            ttl = default_ttl
+        if max_objects is None:
+            max_objects = default_max_objects
+        return ttl, max_objects
+
+    def poll_events(self):
+        '''
+        Reads the engine events following the last processed one, and
+        records the ids of the objects they refer to, for each collection to
+        pick them up in its next incremental refresh.
+        Returns False if there was no events cursor yet, in which case it is
+        set to the latest event and a full refresh is needed. Cached
+        collections predate the cursor, so they are dropped.
+        '''
+        events_service = self._api.system_service().events_service()
+        if self._last_event_id is None:
+            events = events_service.list(max=1)
+            self._last_event_id = max([int(event.id) for event in events]
+                                      or [0])
+            if self._cache is not None:
+                self._cache.flush()
+            return False
+
+        events = events_service.list(from_=self._last_event_id)
+        attrs = set([collection.event_attr
+                     for collection in self.get_collections()])
+        for event in events:
+            self._last_event_id = max(self._last_event_id, int(event.id))
+            for attr in attrs:
+                ref = getattr(event, attr, None) if attr else None
+                if ref is not None and ref.id is not None:
+                    self._changes.setdefault(attr, set()).add(ref.id)
+        return True
+
+    def take_changes(self, event_attr):
+        '''
+        Returns and forgets the ids of the objects of a collection that
+        changed according to the events polled so far.
+        '''
+        return self._changes.pop(event_attr, set())
+
+    def _token_cache(self):
+        '''
+        Returns the SSO token cache, kept next to the shell preferences, or
+        None if token caching is disabled.
+        '''
+        prefs_file = getattr(self.shell, '_prefs_file', None)
+        if not self.shell.prefs['token_cache'] or prefs_file is None:
+            return None
+        ttl = self.shell.prefs['token_ttl']
+        if ttl is None:
+            ttl = default_token_ttl
+        path = os.path.join(os.path.dirname(str(prefs_file)), token_file)
+        return TokenCache(path, ttl)
+
+    def _save_token(self):
+        try:
+            self._tokens.put(self._ip, self._username,
+                             self._api.authenticate())
+        except Exception as error:
+            self.shell.log.warning("Failed to cache the SSO token: %s"
+                                   % error)
+
+    def get_api_info(self):
+        '''
+        Returns the API entry point of oVirt Engine, as a types.Api, or None
+        if disconnected.
+        '''
+        if self._api is None:
+            return None
+        return self.cached(self._api.system_service().get)
+
+    def get_api_summary(self):
+        '''
+        Returns the numbers of objects oVirt Engine reports in its API entry
+        point, as a types.ApiSummary, or None.
+        '''
+        info = self.get_api_info()
+        return info and info.summary
+
+    def describe(self, info):
+        '''
+        Returns the status line of the engine, given its API entry point.
+        '''
+        return "Engine %s: %s" % (self._ip,
+                                  info.product_info.version.full_version)
+
+    def summary(self):
+        if self._api is None:
+            return "Disconnected", None
+        return self.describe(self.get_api_info()), None
+
+    def connect(self, username, password, ip):
+        '''
+        Connects to oVirt Engine, and lists its collections.
+        '''
+        if self._api is not None:
+            raise ExecutionError("Already connected. Disconnect first")
+
+        if '://' in ip:
+            full_url = '%s/ovirt-engine/api' % ip.rstrip('/')
+        else:
+            full_url = 'https://%s/ovirt-engine/api' % ip
+
+        self.shell.log.info("Connecting to %s..." % ip)
+
+        tokens = self._token_cache()
+        token = None
+        if tokens is not None:
+            token = tokens.get(ip, username)
+
+        # The credentials are passed along with the cached token, so that the
+        # SDK logs in again by itself if the token turns out to have expired.
+        import ovirtsdk4 as sdk
+        api = sdk.Connection(
+            url=full_url,
+            username=username,
+            password=password,
+            token=token,
+            insecure=True,
+            connections=self.shell.prefs['connections'] or 0,
+            pipeline=self.shell.prefs['pipeline'] or 0,
+        )
+
+        if api is None:
+            raise ExecutionError("Failed to create API object")
+        instrument(api)
+
+        # Without a cached token, logging in before test() accounts the
+        # login in 'stats'.
+        if token is not None and self.shell.prefs['trust_cached_token']:
+            self.shell.log.debug("Reusing the cached SSO token.")
+        elif (token is None and not login(api)) \
+                or not api.test(raise_exception=False):
+            if tokens is not None:
+                tokens.drop(ip, username)
+            api.close(logout=False)
+            raise ExecutionError("Failed to test connection to oVirt Engine.")
+
+        self.shell.log.info("Connected to oVirt Engine.")
+        self._api = api
+        self._ip = ip
+        self._username = username
+        self._tokens = tokens
+        if tokens is not None:
+            self._save_token()
+        self._cache = CollectionCache(*self._cache_prefs())
+        self._last_event_id = None
+        self._changes = {}
+        self.refresh()
+
+    def disconnect(self):
+        '''
+        Closes the connection, keeping the SSO token valid if it is cached.
+        '''
+        if self._tokens is not None:
+            # Keep the token valid for the next session.
+            self._save_token()
+            self._api.close(logout=False)
+        else:
+            self._api.close()
+        self._api = None
+        self._ip = None
+        self._username = None
+        self._tokens = None
+        self._cache = None
+        self._last_event_id = None
+        self._changes = {}
+        if self.parent is None:
+            self.shell.log.info('Disconnected from oVirt Engine.')
+        else:
+            self.shell.log.info('Disconnected from oVirt Engine %s.'
+                                % self.name)
+
+    def ui_command_disconnect(self):
+        '''
+        Disconnects from this oVirt Engine, and removes it from the tree.
+
+        SEE ALSO
+        ========
+        B{connect}
+        '''
+        return self.get_root().remove_engine(self)
+
+    def ui_command_cache(self, action='show', ttl=None, max_objects=None):
+        '''
+        Inspects, flushes or tunes the collection cache of the engine.
+
+        PARAMETERS
+        ==========
+
+        action
+        ------
+        Either 'show' (the default) to list the cached collections, or
+        'flush' to drop all of them.
+
+        ttl
+        ---
+        Number of seconds collections are cached for, 0 to disable caching.
+
+        max_objects
+        -----------
+        Maximum number of objects cached, least recently used collections
+        are evicted first.
+
+        SEE ALSO
+        ========
+        B{refresh} B{invalidate}
+        '''
+        if ttl is not None:
+            self.shell.prefs['cache_ttl'] = self.ui_eval_param(ttl, 'number',
+                                                               None)
+        if max_objects is not None:
+            self.shell.prefs['cache_max_objects'] = \
+                self.ui_eval_param(max_objects, 'number', None)
+
+        if self._cache is None:
+            self.shell.log.info("Not connected, no cache.")
+            return
+        self._cache.configure(*self._cache_prefs())
+
+        if action == 'flush':
+            self._cache.flush()
+            self.shell.log.info("Cache flushed.")
+        elif action == 'show':
+            cache = self._cache
+            self.shell.con.display("TTL: %ds, objects: %d/%d, hits: %d, "
+                                   "misses: %d, evictions: %d"
+                                   % (cache.ttl, len(cache), cache.max_objects,
+                                      cache.hits, cache.misses,
+                                      cache.evictions))
+            for key, objects, age in cache.entries():
+                self.shell.con.display("  %s: %d objects, %ds old"
+                                       % (key, objects, age))
+        else:
+            raise ExecutionError("Unknown cache action %s" % action)
+
+    def ui_complete_cache(self, parameters, text, current_param):
+        if current_param != 'action':
+            return []
+        return [action for action in ('show', 'flush')
+                if action.startswith(text)]
@@ -14,14 +14,103 @@ License for the specific language governing permissions and limitations
 under the License.
 '''
 
+import re
+from abc import ABCMeta, abstractmethod
+from collections import namedtuple
+
 from configshell_fb import ConfigNode, ExecutionError
 
+from .bulk import compile_pattern, is_pattern, regex_prefix, run_concurrently
+from .refresh import refresh_nodes
+from .stats import request_stats
+
+no_children = frozenset()
+# Prefix of the names of views, which object names cannot contain.
+view_prefix = ':'
+view_name = re.compile(r'^[A-Za-z0-9_.\-]+$')
+# The record types of make_record(), by fields.
+record_types = {}
+
+def record_type(fields):
+    '''
+    Returns the named tuple type of the records of the given attributes,
+    see make_record(). The field of an attribute path such as 'cluster.id'
+    is named 'cluster_id'.
+    '''
+    fields = tuple(field.replace('.', '_') for field in fields)
+    record = record_types.get(fields)
+    if record is None:
+        record = namedtuple('Record', ('id',) + fields)
+        record_types[fields] = record
+    return record
+
+def get_path(entity, path):
+    '''
+    Returns the attribute of entity at path, such as 'cluster.id', or None
+    if any attribute along it is not set, or missing from a record of other
+    fields, such as read from an older snapshot.
+    '''
+    for name in path.split('.'):
+        if entity is None:
+            return None
+        entity = getattr(entity, name, None)
+    return entity
+
+def make_record(entity, fields):
+    '''
+    Returns a compact record of an SDK object: a named tuple of its id and
+    the given attributes, which is all the tree needs of it. Attributes
+    can be paths, so that only the id of a linked object is kept rather
+    than the whole SDK object. Records are returned as is.
+    '''
+    record = record_type(fields)
+    if isinstance(entity, record):
+        return entity
+    return record._make([entity.id] + [get_path(entity, field)
+                                       for field in fields])
+
+def search_query(text):
+    '''
+    Returns the oVirt Engine search query typed as text, in which commas
+    stand for ' and ', as spaces cannot be typed in parameters.
+    '''
+    return ' and '.join(condition for condition in text.split(',')
+                        if condition)
+
+def describe(value):
+    '''
+    Returns the text showing an attribute of an SDK object, or None if it
+    is not set. Linked objects are shown by name or id, lists of them as
+    a comma separated list.
+    '''
+    if value is None:
+        return None
+    if isinstance(value, list):
+        return ', '.join(text for text in map(describe, value) if text)
+    if hasattr(value, 'href'):
+        return getattr(value, 'name', None) or getattr(value, 'id', None)
+    return str(value)
+
 class UINode(ConfigNode):
     '''
     oVirt Engine basic UI node.
+    All the nodes have the same configuration parameters, the global ones,
+    so they are only defined by the first node, and shared by the others.
     '''
+    # The configuration groups shared by all the nodes, once defined.
+    _shared_groups = None
+    _api = None
+    _ip = None
+    _cache = None
+    _stale = False
+    # Whether the node is a connection to oVirt Engine, see UIEngine.
+    is_engine = False
+
     def __init__(self, name, parent=None, shell=None):
         ConfigNode.__init__(self, name, parent, shell)
+        if UINode._shared_groups is not None:
+            self._configuration_groups = UINode._shared_groups
+            return
         self.define_config_group_param(
             'global', 'auto_cd_after_create', 'bool',
             'If true, changes current path to newly created objects.')
@@ -31,8 +120,56 @@ class UINode(ConfigNode):
         self.define_config_group_param(
             'global', 'username', 'string',
             'Username to use to connect to oVirt Engine.')
-        self._api = None
-        self._ip = None
+        self.define_config_group_param(
+            'global', 'lazy_refresh', 'bool',
+            'If true, collections are only fetched when first browsed.')
+        self.define_config_group_param(
+            'global', 'refresh_concurrency', 'number',
+            'Maximum number of collections fetched in parallel.')
+        self.define_config_group_param(
+            'global', 'cache_ttl', 'number',
+            'Seconds collections are cached for, 0 to disable caching.')
+        self.define_config_group_param(
+            'global', 'cache_max_objects', 'number',
+            'Maximum number of objects kept in the collection cache.')
+        self.define_config_group_param(
+            'global', 'incremental_refresh', 'bool',
+            'If true, refresh only applies changes reported by engine events.')
+        self.define_config_group_param(
+            'global', 'page_size', 'number',
+            'Number of objects fetched per request by paged collections.')
+        self.define_config_group_param(
+            'global', 'token_cache', 'bool',
+            'If true, SSO tokens are kept on disk and reused by later sessions.')
+        self.define_config_group_param(
+            'global', 'token_ttl', 'number',
+            'Seconds a cached SSO token is reused for after its last use.')
+        self.define_config_group_param(
+            'global', 'trust_cached_token', 'bool',
+            'If true, connecting with a cached SSO token skips the connection test.')
+        self.define_config_group_param(
+            'global', 'bulk_concurrency', 'number',
+            'Maximum number of actions of a bulk command sent in parallel.')
+        self.define_config_group_param(
+            'global', 'connections', 'number',
+            'Maximum number of HTTP connections to each engine, 0 for no limit.')
+        self.define_config_group_param(
+            'global', 'pipeline', 'number',
+            'Maximum number of requests pipelined on a connection, 0 to disable.')
+        self.define_config_group_param(
+            'global', 'auto_refresh', 'number',
+            'Seconds between background refreshes of loaded objects, 0 to disable.')
+        self.define_config_group_param(
+            'global', 'output_format', 'outputformat',
+            'Output of ls and status: text, or one JSON or CSV record per node.')
+        UINode._shared_groups = self._configuration_groups
+
+    def define_config_group_param(self, group, param, type, description=None,
+                                  writable=True):
+        # ConfigNode.__init__() defines its parameters on every node.
+        if UINode._shared_groups is None:
+            ConfigNode.define_config_group_param(self, group, param, type,
+                                                 description, writable)
 
     def get_api(self):
         return self._api
@@ -40,6 +177,40 @@ class UINode(ConfigNode):
     def is_connected(self):
         return (self._api is not None)
 
+    def get_engine(self):
+        '''
+        Returns the engine node this node belongs to.
+        '''
+        node = self
+        while not node.is_engine:
+            node = node.parent
+        return node
+
+    def get_cache(self):
+        return self.get_engine()._cache
+
+    def cached(self, loader, query=None):
+        '''
+        Calls loader() through the connection's collection cache, keyed by
+        this node's path and the optional query string.
+        '''
+        cache = self.get_cache()
+        if cache is None:
+            return loader()
+        if query is None:
+            key = self.path
+        else:
+            key = '%s?%s' % (self.path, query)
+        return cache.get(key, loader)
+
+    def flush_cache(self):
+        '''
+        Drops the cached collections of this node and its descendants.
+        '''
+        cache = self.get_cache()
+        if cache is not None:
+            cache.flush(self.path)
+
     def new_node(self, new_node):
         '''
         Used to honor global 'auto_cd_after_create'.
@@ -56,30 +227,231 @@ class UINode(ConfigNode):
         else:
             return None
 
+    def _list_children(self):
+        '''
+        Lists the children of this node, fetching them first if stale.
+        '''
+        self.ensure_loaded()
+        return self._children
+
+    children = property(_list_children,
+                        doc="Lists the node's children.")
+
+    def get_child(self, name):
+        self.ensure_loaded()
+        return ConfigNode.get_child(self, name)
+
+    def is_stale(self):
+        return self._stale
+
+    def invalidate(self):
+        '''
+        Marks this node as stale: its children will be fetched again the
+        next time they are browsed.
+        '''
+        self._stale = True
+
+    def ensure_loaded(self):
+        '''
+        Refreshes this node if it was marked stale.
+        '''
+        if self._stale:
+            self._stale = False
+            self.refresh()
+
     def refresh(self):
         '''
         Refreshes and updates the objects tree from the current path.
         '''
-        for child in self.children:
-            child.refresh()
+        refresh_nodes(self.children,
+                      self.shell.prefs['refresh_concurrency'])
+
+    def execute_command(self, command, pparams=[], kparams={}):
+        '''
+        Applies the tree updates posted by background threads, then runs
+        the command, accounting the requests it sends to it.
+        '''
+        request_stats.start_command('%s %s' % (self.path, command))
+        root = self.get_root()
+        root.run_deferred()
+        try:
+            return ConfigNode.execute_command(self, command, pparams, kparams)
+        finally:
+            root.update_refresher()
+
+    def get_output_format(self, output_format):
+        '''
+        Returns the output format of a command, output_format if given,
+        or else the global 'output_format'.
+        '''
+        from .output import output_formats
+        if output_format is None:
+            output_format = self.shell.prefs['output_format'] or 'text'
+        if output_format not in output_formats:
+            raise ExecutionError("The output format must be one of %s."
+                                 % ', '.join(output_formats))
+        return output_format
+
+    def write_records(self, output_format, records):
+        '''
+        Writes records in a machine readable output format, each as soon as
+        it is yielded. See RecordWriter.
+        '''
+        from .output import RecordWriter
+        writer = RecordWriter(self.shell.con._stdout, output_format)
+        writer.write_all(records)
+
+    def output_record(self):
+        '''
+        Returns what the machine readable output formats show of this node:
+        its path, kind, name and summary().
+        '''
+        description, is_healthy = self.summary()
+        record = {
+            'path': self.path,
+            'kind': type(self).__name__.replace('UI', '', 1),
+            'name': self.name,
+            'summary': description,
+        }
+        if is_healthy is not None:
+            record['healthy'] = is_healthy
+        return record
+
+    def iter_records(self, depth=None):
+        '''
+        Yields the output records of this node and of its descendants, down
+        to depth levels below it, or all of them if None, each node before
+        its children, in the order of the rendered tree.
+        '''
+        from .output import sort_key
+        yield self.output_record()
+        if depth is not None:
+            if depth <= 0:
+                return
+            depth -= 1
+        for child in sorted(self.children, key=sort_key):
+            for record in child.iter_records(depth):
+                yield record
+
+    def ui_command_ls(self, path=None, depth=None, format=None):
+        '''
+        Display either the nodes tree relative to path or to the current node.
+
+        Paged collections that are not loaded yet (such as VMs) are listed
+        page by page, each page being displayed as soon as it is fetched.
+        The whole tree of engines is listed after fetching their collections
+        concurrently.
+
+        With the json or csv format, each node is written as a record, a
+        JSON line or a CSV row, as soon as it is loaded, instead of
+        rendering the whole tree first.
+
+        PARAMETERS
+        ==========
+
+        path
+        ----
+        The path to display the nodes tree of. Can be an absolute path, a
+        relative path or a bookmark.
+
+        depth
+        -----
+        The depth parameter limits the maximum depth of the tree to display.
+        If set to 0, then the complete tree will be displayed (the default).
+
+        format
+        ------
+        text, json or csv, defaults to the global 'output_format'. JSON
+        records have the path, kind, name and summary of the node, and the
+        attributes of objects. CSV rows have their path, kind, name, id,
+        summary and health, after a header line.
+
+        SEE ALSO
+        ========
+        cd bookmarks status
+        '''
+        output_format = self.get_output_format(format)
+        try:
+            target = self.get_node(path)
+        except ValueError as msg:
+            raise ExecutionError(str(msg))
+
+        if output_format == 'text' and isinstance(target, UICollection) \
+           and target.paged and target.is_stale():
+            target.stream_ls()
+            return
+
+        if depth is None:
+            depth = self.shell.prefs['tree_max_depth']
+        try:
+            depth = int(depth or 0)
+        except ValueError:
+            raise ExecutionError('The tree depth must be a number.')
+        if target.is_engine and not depth:
+            target.prefetch()
+        if output_format != 'text':
+            self.write_records(output_format,
+                               target.iter_records(depth or None))
+            return
+        ConfigNode.ui_command_ls(self, path, depth)
+
+    def ui_complete_ls(self, parameters, text, current_param):
+        if current_param == 'format':
+            from .output import output_formats
+            return [name for name in output_formats if name.startswith(text)]
+        return ConfigNode.ui_complete_ls(self, parameters, text,
+                                         current_param)
 
     def ui_command_refresh(self):
         '''
         Refreshes and updates the objects tree from the current path.
+        Cached collections below the current path are fetched again, unless
+        the global 'incremental_refresh' is True.
         '''
+        if not self.shell.prefs['incremental_refresh']:
+            self.flush_cache()
+        self._stale = False
         self.refresh()
 
-    def ui_command_status(self):
+    def ui_command_invalidate(self):
+        '''
+        Marks the current node as stale, so that its objects are fetched
+        again from oVirt Engine the next time they are browsed.
+
+        SEE ALSO
+        ========
+        B{refresh}
+        '''
+        self.invalidate()
+
+    def ui_command_status(self, format=None):
         '''
         Displays the current node's status summary.
 
+        PARAMETERS
+        ==========
+
+        format
+        ------
+        text, json or csv, defaults to the global 'output_format'. See ls.
+
         SEE ALSO
         ========
         B{ls}
         '''
+        output_format = self.get_output_format(format)
+        if output_format != 'text':
+            self.write_records(output_format, [self.output_record()])
+            return
         description, is_healthy = self.summary()
         self.shell.log.info("Status for %s: %s" % (self.path, description))
 
+    def ui_complete_status(self, parameters, text, current_param):
+        if current_param == 'format':
+            from .output import output_formats
+            return [name for name in output_formats if name.startswith(text)]
+        return []
+
     def ui_setgroup_global(self, parameter, value):
         ConfigNode.ui_setgroup_global(self, parameter, value)
         self.get_root().refresh()
@@ -106,4 +478,945 @@ class UINode(ConfigNode):
             raise ValueError("Syntax error, '%s' is not %s."
                              % (value, syntax))
 
+    def ui_type_outputformat(self, value=None, enum=False, reverse=False):
+        '''
+        UI parameter type helper for the output formats, see output_formats.
+        '''
+        from .output import output_formats
+        if reverse:
+            if value is not None:
+                return value
+            else:
+                return 'text'
+        syntax = '|'.join(output_formats)
+        if value is None:
+            if enum:
+                return list(output_formats)
+            else:
+                return syntax
+        elif value in output_formats:
+            return value
+        else:
+            raise ValueError("Syntax error, '%s' is not %s."
+                             % (value, syntax))
+
+
+class UICollection(UINode, metaclass=ABCMeta):
+    '''
+    Base UI node for containers of oVirt Engine objects.
+    Subclasses implement fetch(), which lists the collection and may run in
+    a worker thread, make_node(), which builds the child node for one
+    object, entity_service(), which returns the service of one object, and
+    search(), which runs an engine search query on the collection.
+    Children are kept in sync with the fetched objects by id, so a refresh
+    only creates, renames or removes the nodes that changed. The nodes
+    double as an id and name index of the loaded objects, used by find().
+    Collections are created stale, and fetched on first browse, or right
+    away by UIRoot if the global 'lazy_refresh' is False.
+    Their views, listing the objects matching a search query, are children
+    too, recreated from the preferences. See UIView.
+    '''
+    # Attribute of types.Event referring to objects of this collection.
+    event_attr = None
+    # Attribute of types.ApiSummary counting objects of this collection.
+    summary_attr = None
+    # Whether iter_pages() fetches the collection in several requests.
+    paged = False
+
+    def __init__(self, name, parent):
+        UINode.__init__(self, name, parent)
+        self._stale = True
+        self._populated = False
+        self._loading = False
+        self._nodes = {}
+        self._names = {}
+        self._views = {}
+        # Counts the changes of the nodes, see referring().
+        self._version = 0
+        self._indexes = {}
+        saved = (self.shell.prefs['views'] or {}).get(self.path, {})
+        for view, query in sorted(saved.items()):
+            self._views[view] = UIView(self, view, query)
+
+    def get_collection(self):
+        '''
+        Returns the collection the objects of this node belong to.
+        '''
+        return self
+
+    def get_child(self, name):
+        # Views are looked up without listing the whole collection.
+        if name.startswith(view_prefix):
+            view = self._views.get(name[len(view_prefix):])
+            if view is None:
+                raise ValueError("No such path %s/%s" % (self.path.rstrip('/'), name))
+            return view
+        self.ensure_loaded()
+        entity_id = self._names.get(name)
+        if entity_id is None:
+            return UINode.get_child(self, name)
+        return self._nodes[entity_id]
+
+    @abstractmethod
+    def fetch(self):
+        '''
+        Lists the collection from oVirt Engine, usually through cached().
+        Must not touch the objects tree. Implemented by the collections of
+        ui_ovirtcli, UIView, UIJoin and SnapshotCollection.
+        '''
+
+    def iter_pages(self):
+        '''
+        Yields the collection in pages, as lists of objects.
+        '''
+        yield self.fetch()
+
+    def stream_ls(self):
+        '''
+        Populates the collection page by page, displaying the nodes of each
+        page as soon as it is fetched instead of rendering them all at once.
+        '''
+        def started():
+            self.shell.con.display(self._render_tree(self, depth=0))
+        for nodes in self.iter_node_pages(started):
+            lines = [self._render_tree(node, margin=[0, True], depth=0)
+                     for node in nodes]
+            if lines:
+                self.shell.con.display(''.join(lines), no_lf=True)
+
+    def iter_records(self, depth=None):
+        # Paged collections are written page by page as they are loaded.
+        if not (self.paged and self.is_stale()):
+            for record in UINode.iter_records(self, depth):
+                yield record
+            return
+        header = []
+        started = None
+        if self.count_active() is not None:
+            # Counted by oVirt Engine, without waiting for the listing.
+            yield self.output_record()
+        else:
+            # Summarized once loading, as stream_ls() renders it.
+            started = lambda: header.append(self.output_record())
+        pages = self.iter_node_pages(started)
+        if depth is not None:
+            depth -= 1
+        for nodes in pages:
+            while header:
+                yield header.pop()
+            if depth is not None and depth < 0:
+                continue
+            for node in nodes:
+                for record in node.iter_records(depth):
+                    yield record
+        while header:
+            yield header.pop()
+
+    def iter_node_pages(self, started=None):
+        '''
+        Populates the collection page by page, yielding the nodes of each
+        page as soon as it is fetched. The listing completes once all the
+        pages are read.
+        @param started: Called once the collection is loading, before the
+        first page is fetched.
+        @type started: callable
+        '''
+        cache = self.get_cache()
+        entities = None
+        if cache is not None:
+            entities = cache.lookup(self.path)
+        if entities is not None:
+            pages = [entities]
+        else:
+            pages = self.iter_pages()
+
+        if self.event_attr is not None:
+            self.get_engine().take_changes(self.event_attr)
+        self._stale = False
+        self._loading = True
+        try:
+            if started is not None:
+                started()
+            seen = set()
+            for page in pages:
+                nodes = []
+                for entity in page:
+                    seen.add(entity.id)
+                    self.sync_entity(entity.id, entity)
+                    nodes.append(self._nodes[entity.id])
+                yield nodes
+        except:
+            self._stale = True
+            raise
+        finally:
+            self._loading = False
+
+        for entity_id in list(self._nodes.keys()):
+            if entity_id not in seen:
+                self.sync_entity(entity_id, None)
+        self._populated = True
+        if entities is None:
+            self.update_cache()
+
+    def list_records(self, service, fields, **query):
+        '''
+        Lists a collection service, as records of the given attributes of
+        its objects, see make_record(). The listing asks for neither
+        all_content nor follow, the lightest representation of the objects
+        oVirt Engine has, and only the records are kept. The objects are
+        still parsed whole: the API cannot select attributes, and the SDK
+        has no public way to parse part of a response.
+        @param query: The parameters of the service's list() method, such
+        as search or max.
+        '''
+        entities = service.list(**query)
+        return [make_record(entity, fields) for entity in entities]
+
+    @abstractmethod
+    def make_node(self, entity, parent=None):
+        '''
+        Creates the node for entity, a child of parent, which defaults to
+        the collection itself. Implemented by the collections of ui_ovirtcli,
+        UIView and UIJoin, which use the node class of their collection.
+        '''
+
+    @abstractmethod
+    def entity_service(self, entity_id):
+        '''
+        Returns the service of the object with the given id. Implemented by
+        the collections of ui_ovirtcli, UIView, UIJoin and
+        SnapshotCollection, which fails as read-only.
+        '''
+
+    @abstractmethod
+    def search(self, query):
+        '''
+        Lists the objects of the collection matching an engine search query,
+        as records. See list_records(). Implemented by the collections of
+        ui_ovirtcli, UIView, UIJoin and SnapshotCollection, which fails as
+        read-only.
+        '''
+
+    def count_active(self):
+        '''
+        Returns the number of objects of the collection and of the active
+        ones, such as the UP hosts, reported by oVirt Engine without
+        listing them, or None if it does not count them.
+        '''
+        if self.summary_attr is None:
+            return None
+        summary = self.get_engine().get_api_summary()
+        counts = summary and getattr(summary, self.summary_attr, None)
+        if counts is None or counts.total is None:
+            return None
+        return counts.total, counts.active
+
+    def loaded_entities(self):
+        '''
+        Returns the objects of the collection if they are loaded or cached,
+        or None rather than fetching them.
+        '''
+        if self._populated:
+            return self.get_entities()
+        cache = self.get_cache()
+        if cache is None:
+            return None
+        return cache.lookup(self.path)
+
+    def load_entities(self):
+        '''
+        Returns the objects of the collection, loading it if they are
+        neither loaded nor cached, so that browsing its children next does
+        not list it again, even with the cache disabled.
+        '''
+        entities = self.loaded_entities()
+        if entities is None:
+            self.ensure_loaded()
+            entities = self.get_entities()
+        return entities
+
+    def is_populated(self):
+        return self._populated
+
+    def populate(self, entities):
+        '''
+        Syncs the children nodes with the fetched objects.
+        '''
+        self._populated = True
+        self.sync(entities)
+
+    def sync(self, entities):
+        '''
+        Diffs entities against the current children by id: nodes of objects
+        that vanished are removed, existing ones are updated in place and
+        new ones are created.
+        '''
+        entities = entities or []
+        ids = set(entity.id for entity in entities)
+        for entity_id in list(self._nodes.keys()):
+            if entity_id not in ids:
+                self.sync_entity(entity_id, None)
+        for entity in entities:
+            self.sync_entity(entity.id, entity)
+
+    def sync_entity(self, entity_id, entity):
+        '''
+        Syncs the child node of a single object, None meaning it is gone.
+        '''
+        self._version += 1
+        node = self._nodes.get(entity_id)
+        if entity is None:
+            if node is not None:
+                self.remove_child(node)
+                del self._nodes[entity_id]
+                self._names.pop(node.name, None)
+        elif node is None:
+            self._nodes[entity_id] = self._add_node(entity)
+            self._names[entity.name] = entity_id
+        else:
+            if entity.name != node.name:
+                self._names.pop(node.name, None)
+                self._names[entity.name] = entity_id
+            node.update(entity)
+
+    def _add_node(self, entity):
+        if entity.name in self._names:
+            raise ValueError("Name '%s' already used by a sibling."
+                             % entity.name)
+        # ConfigNode checks a new node's name against all of its siblings,
+        # which gets quadratic on large collections. Names are already
+        # checked against the index, so hide the siblings meanwhile.
+        children = self._children
+        self._children = set()
+        try:
+            node = self.make_node(entity)
+        finally:
+            children.update(self._children)
+            self._children = children
+        return node
+
+    def get_entities(self):
+        return [node.get_entity() for node in self._nodes.values()]
+
+    def lookup_id(self, entity_id):
+        '''
+        Returns the loaded object with the given id, or None.
+        '''
+        node = self._nodes.get(entity_id)
+        if node is None:
+            return None
+        return node.get_entity()
+
+    def referring(self, field, entity_id):
+        '''
+        Returns the loaded objects whose record field is entity_id, such as
+        the hosts whose 'cluster_id' is a cluster's, without any request.
+        They are looked up in an index of the collection by field, built
+        once per change of the collection.
+        '''
+        version, index = self._indexes.get(field, (None, None))
+        if version != self._version:
+            index = {}
+            for node in self._nodes.values():
+                entity = node.get_entity()
+                index.setdefault(getattr(entity, field), []).append(entity)
+            self._indexes[field] = (self._version, index)
+        return index.get(entity_id, [])
+
+    def find(self, name):
+        '''
+        Returns the object named name, or None if there is none.
+        The index of loaded objects is looked up first, so that commands can
+        go straight to the object's service. oVirt Engine is only searched
+        on a miss, the result then being added to the loaded objects.
+        '''
+        entity_id = self._names.get(name)
+        if entity_id is not None:
+            return self.lookup_id(entity_id)
+
+        entities = self.search('name=%s' % name)
+        if not entities:
+            return None
+        entity = entities[0]
+        if self._populated:
+            self.update_entity(entity.id, entity)
+        return entity
+
+    def update_entity(self, entity_id, entity):
+        '''
+        Records a change made from the shell to a single object, None
+        meaning it was removed, keeping the nodes, index and cache current
+        without listing the whole collection again.
+        '''
+        self.invalidate_views()
+        if not self._populated:
+            # Nothing loaded to keep current, just list it next time.
+            self.flush_cache()
+            return
+        self.sync_entity(entity_id, entity)
+        self.update_cache()
+
+    def update_entities(self, changes):
+        '''
+        Like update_entity(), for a list of (id, object) tuples, the cache
+        being updated once for all of them.
+        '''
+        if not changes:
+            return
+        self.invalidate_views()
+        if not self._populated:
+            self.flush_cache()
+            return
+        for entity_id, entity in changes:
+            self.sync_entity(entity_id, entity)
+        self.update_cache()
+
+    def select(self, names, not_found):
+        '''
+        Returns the objects selected by names, sorted by name: a comma
+        separated list of names or glob patterns, such as 'host-rack3-*',
+        or a single regular expression prefixed with 're:'. Plain names are
+        looked up with find(), patterns are matched against the loaded
+        objects, the collection being fetched first if needed.
+        @param not_found: Message logged for each name or pattern selecting
+        no object, with a '%s' for it.
+        @raise ExecutionError: If a regular expression is invalid.
+        '''
+        if names.startswith(regex_prefix):
+            patterns = [names]
+        else:
+            patterns = [name for name in names.split(',') if name]
+
+        selected = {}
+        for pattern in patterns:
+            if not is_pattern(pattern):
+                entity = self.find(pattern)
+                if entity is None:
+                    self.shell.log.info(not_found % pattern)
+                else:
+                    selected[entity.id] = entity
+                continue
+
+            try:
+                matches = compile_pattern(pattern)
+            except ValueError as error:
+                raise ExecutionError(str(error))
+            self.ensure_loaded()
+            ids = [entity_id for name, entity_id in self._names.items()
+                   if matches(name)]
+            if not ids:
+                self.shell.log.info(not_found % pattern)
+            for entity_id in ids:
+                selected[entity_id] = self.lookup_id(entity_id)
+        return sorted(selected.values(), key=lambda entity: entity.name)
+
+    def select_current(self, names, not_found):
+        '''
+        Like select(), but returns the objects as oVirt Engine has them now,
+        fetched again with fetch_details(), rather than as last listed, for
+        the commands depending on their state. Their nodes are updated, and
+        the objects no longer found are logged with not_found and dropped.
+        @raise Exception: The first error fetching an object, if any.
+        '''
+        import ovirtsdk4 as sdk
+        entities = self.select(names, not_found)
+        results = self.fetch_details(
+            entities,
+            lambda entity: self.entity_service(entity.id).get(wait=False))
+        current = []
+        changes = []
+        failed = None
+        for entity, result, error in results:
+            if isinstance(error, sdk.NotFoundError):
+                self.shell.log.info(not_found % entity.name)
+                changes.append((entity.id, None))
+            elif error is not None:
+                failed = failed or error
+            else:
+                current.append(result)
+                changes.append((entity.id, result))
+        self.update_entities(changes)
+        if failed is not None:
+            raise failed
+        return current
+
+    def run_bulk(self, entities, steps, summary):
+        '''
+        Runs steps on each of entities, with at most the global
+        'bulk_concurrency' requests in flight, then updates their nodes at
+        once. Each step sends a request with wait=False and returns its
+        future, the last one resulting in the object as it is after the
+        action, or None if it was removed. See run_concurrently().
+        A single failure is raised as is. Otherwise failures are logged per
+        object, and summary, with a '%d' for the number of succeeded
+        actions followed by one for the number of objects, is either logged
+        or raised if any action failed.
+        '''
+        results = run_concurrently(steps, entities,
+                                   self.shell.prefs['bulk_concurrency'])
+        changes = [(entity.id, result)
+                   for entity, result, error in results if error is None]
+        self.update_entities(changes)
+
+        failed = [(entity, error)
+                  for entity, result, error in results if error is not None]
+        if len(entities) == 1:
+            if failed:
+                raise failed[0][1]
+            return
+        for entity, error in failed:
+            self.shell.log.error('%s: %s' % (entity.name, error))
+        message = summary % (len(changes), len(entities))
+        if failed:
+            raise ExecutionError(message)
+        self.shell.log.info(message)
+
+    def fetch_details(self, items, request):
+        '''
+        Sends a request per item, such as the object of an id or the NICs
+        of a host, keeping the engine's request window in flight rather
+        than waiting for each response in turn, see
+        UIEngine.request_window(). request sends it with wait=False and
+        returns its future.
+        @return: A list of (item, result, error) tuples in the order of
+        items, see run_concurrently().
+        '''
+        return run_concurrently([request], items,
+                                self.get_engine().request_window())
+
+    def show_details(self, names, request, describe):
+        '''
+        Displays a line of details for each of the objects selected by
+        names, see select(), fetched with fetch_details(). describe returns
+        the line of an object given the result of its request.
+        '''
+        entities = self.select(names, 'No %s matching %%s.' % self.name)
+        failed = 0
+        for entity, result, error in self.fetch_details(entities, request):
+            if error is not None:
+                self.shell.log.error('%s: %s' % (entity.name, error))
+                failed += 1
+            else:
+                self.shell.con.display('%s: %s' % (entity.name,
+                                                   describe(result)))
+        if failed:
+            raise ExecutionError('Failed to fetch the details of %d of %d '
+                                 'objects.' % (failed, len(entities)))
+
+    def update_cache(self):
+        cache = self.get_cache()
+        if cache is not None:
+            cache.put(self.path, self.get_entities())
+
+    def refresh(self, entities=None):
+        '''
+        Refreshes the container. If entities were already fetched (by a
+        concurrent refresh), they are used instead of listing them again.
+        If the global 'incremental_refresh' is True and the container was
+        already populated, only the objects reported as changed by the
+        engine events feed are fetched again.
+        '''
+        engine = self.get_engine()
+        if entities is None and self._populated \
+           and self.event_attr is not None \
+           and self.shell.prefs['incremental_refresh'] \
+           and engine.poll_events():
+            self._stale = False
+            self.apply_changes(engine.take_changes(self.event_attr))
+            return
+
+        if self.event_attr is not None:
+            # A full listing includes all pending changes.
+            engine.take_changes(self.event_attr)
+        if entities is None:
+            entities = self.fetch()
+        self._stale = False
+        self.populate(entities)
+        for view in self._views.values():
+            view.invalidate()
+
+    def apply_changes(self, ids):
+        '''
+        Fetches again the objects with the given ids and syncs their nodes.
+        Falls back to a full listing when most of the collection changed.
+        '''
+        if not ids:
+            return
+        self.invalidate_views()
+        if len(ids) * 2 > len(self._nodes):
+            self.reload()
+            return
+
+        import ovirtsdk4 as sdk
+        results = self.fetch_details(
+            sorted(ids),
+            lambda entity_id: self.entity_service(entity_id).get(wait=False))
+        failed = None
+        for entity_id, entity, error in results:
+            if error is not None and not isinstance(error, sdk.NotFoundError):
+                failed = failed or error
+                continue
+            self.sync_entity(entity_id, entity)
+        self.update_cache()
+        if failed is not None:
+            raise failed
+
+    def apply_listing(self, entities, version):
+        '''
+        Syncs the nodes with the objects listed in the background by the
+        auto refresher, and caches them, unless the collection changed
+        since it was at version, such as by a command, or was removed from
+        the tree, in which case the listing may be outdated and is dropped.
+        '''
+        if version != self._version or not self._populated \
+           or self not in self.get_engine().get_collections():
+            return
+        self.refresh(entities)
+        self.update_cache()
+
+    def reload(self):
+        '''
+        Refreshes the container bypassing the cache and the events feed, for
+        instance after it was modified.
+        '''
+        self.flush_cache()
+        self._populated = False
+        self.refresh()
+
+    def invalidate_views(self):
+        '''
+        Drops the listings of the views, after objects of the collection
+        changed.
+        '''
+        for view in self._views.values():
+            view.invalidate()
+            view.flush_cache()
+
+    def ui_command_view(self, action='list', name=None, query=None):
+        '''
+        Manages the views of the collection: virtual containers, named
+        :name, of the objects matching an oVirt Engine search query, such
+        as /Hosts/:down for status=down. The engine does the filtering, so
+        that browsing a view only transfers the matching objects. Views are
+        saved in the preferences.
+
+        PARAMETERS
+        ==========
 
+        action
+        ------
+        Either 'list' (the default), 'add' to add or replace the view name,
+        or 'delete' to delete it.
+
+        name
+        ----
+        The name of the view, without the leading ':'.
+
+        query
+        -----
+        The search query of the view, such as status=down. As spaces
+        cannot be typed, commas separate conditions that must all hold,
+        such as status=up,cluster=prod.
+
+        SEE ALSO
+        ========
+        B{count}
+        '''
+        path = self.get_collection().path
+        views = self.shell.prefs['views'] or {}
+        saved = views.get(path, {})
+        if action == 'list':
+            for view in sorted(saved):
+                self.shell.con.display("%s%s: %s"
+                                       % (view_prefix, view, saved[view]))
+            return
+        if action not in ('add', 'delete'):
+            raise ExecutionError("Unknown view action %s" % action)
+        if name is None or not view_name.match(name):
+            raise ExecutionError("Invalid view name %s" % name)
+
+        collection = self.get_collection()
+        old = collection._views.pop(name, None)
+        if old is not None:
+            collection.remove_child(old)
+        if action == 'add':
+            if not query:
+                raise ExecutionError("Missing search query.")
+            saved[name] = search_query(query)
+            collection._views[name] = UIView(collection, name, saved[name])
+            self.shell.log.info("Added view %s/%s%s."
+                                % (path, view_prefix, name))
+        elif old is None:
+            raise ExecutionError("No such view %s" % name)
+        else:
+            saved.pop(name, None)
+            self.shell.log.info("Deleted view %s/%s%s."
+                                % (path, view_prefix, name))
+        if saved:
+            views[path] = saved
+        else:
+            views.pop(path, None)
+        self.shell.prefs['views'] = views
+        self.shell.prefs.save()
+
+    def ui_complete_view(self, parameters, text, current_param):
+        if current_param == 'action':
+            return [action for action in ('list', 'add', 'delete')
+                    if action.startswith(text)]
+        if current_param == 'name':
+            return [name for name in self.get_collection()._views
+                    if name.startswith(text)]
+        return []
+
+    def ui_command_autorefresh(self, interval=None):
+        '''
+        Displays or sets how often the collection is refreshed in the
+        background once loaded, while the global 'auto_refresh' is set.
+
+        PARAMETERS
+        ==========
+
+        interval
+        --------
+        Number of seconds between refreshes, 0 to never refresh the
+        collection in the background, or 'default' to follow the global
+        'auto_refresh'.
+
+        SEE ALSO
+        ========
+        B{refresh}
+        '''
+        path = self.get_collection().path
+        intervals = self.shell.prefs['auto_refresh_intervals'] or {}
+        if interval is None:
+            default = self.shell.prefs['auto_refresh'] or 0
+            seconds = intervals.get(path, default)
+            if not default:
+                self.shell.con.display("Auto refresh is disabled, see the "
+                                       "global auto_refresh.")
+            elif seconds:
+                self.shell.con.display("%s is refreshed every %ds."
+                                       % (path, seconds))
+            else:
+                self.shell.con.display("%s is not refreshed in the "
+                                       "background." % path)
+            return
+        if interval == 'default':
+            intervals.pop(path, None)
+        else:
+            seconds = self.ui_eval_param(interval, 'number', None)
+            if seconds is None or seconds < 0:
+                raise ExecutionError("Invalid interval %s" % interval)
+            intervals[path] = seconds
+        self.shell.prefs['auto_refresh_intervals'] = intervals
+        self.shell.prefs.save()
+
+    def ui_complete_autorefresh(self, parameters, text, current_param):
+        if current_param == 'interval' and 'default'.startswith(text):
+            return ['default']
+        return []
+
+    def ui_command_count(self, query=None):
+        '''
+        Displays the number of objects of the collection, or of the ones
+        matching an oVirt Engine search query. Without a query, loaded
+        objects are counted, or else oVirt Engine is asked for the count.
+        With a query, only the matching objects are transferred.
+
+        PARAMETERS
+        ==========
+
+        query
+        -----
+        A search query, such as status=down. As spaces cannot be typed,
+        commas separate conditions that must all hold.
+
+        SEE ALSO
+        ========
+        B{view}
+        '''
+        if query:
+            count = len(self.search(search_query(query)))
+        else:
+            entities = self.loaded_entities()
+            if entities is not None:
+                count = len(entities)
+            else:
+                counts = self.count_active()
+                count = counts[0] if counts else len(self.fetch())
+        self.shell.con.display(str(count))
+
+
+class UIView(UICollection):
+    '''
+    A virtual container of the objects of a collection matching an oVirt
+    Engine search query, such as 'status=down'. The engine filters them, so
+    only the matching objects are transferred. Views are children of their
+    collection, named after view_prefix, and are kept current like it,
+    actions on their objects updating the collection.
+    '''
+    def __init__(self, collection, name, query):
+        UICollection.__init__(self, view_prefix + name, collection)
+        self._collection = collection
+        self.query = query
+
+    def get_collection(self):
+        return self._collection
+
+    def fetch(self):
+        return self.cached(lambda: self._collection.search(self.query))
+
+    def make_node(self, entity, parent=None):
+        return self._collection.make_node(entity, parent or self)
+
+    def entity_service(self, entity_id):
+        return self._collection.entity_service(entity_id)
+
+    def search(self, query):
+        return self._collection.search('%s and %s' % (self.query, query))
+
+    def summary(self):
+        # Listed again once invalidated, see invalidate_views().
+        self.ensure_loaded()
+        return '%s: %d' % (self.query, len(self._nodes)), None
+
+
+class UIJoin(UICollection):
+    '''
+    A virtual container of the objects of one of the engine's collections
+    linked to the object of its parent node, such as the clusters of a
+    data center. They are joined client side, from the loaded collection
+    and its index of the linking field (see UICollection.referring()),
+    rather than queried from oVirt Engine for each parent. The join is
+    done again whenever the collection changed.
+    @param name: The name of the joined collection, such as 'Clusters'.
+    @type name: str
+    @param field: The field of its records linking to the parent object,
+    such as 'data_center_id'.
+    @type field: str
+    '''
+    def __init__(self, name, parent, field):
+        UICollection.__init__(self, name, parent)
+        self._field = field
+        self._joined_version = None
+
+    def get_collection(self):
+        return self.get_engine().find_collection(self.name)
+
+    def ensure_loaded(self):
+        collection = self.get_collection()
+        if collection is not None \
+           and (collection.is_stale()
+                or collection._version != self._joined_version):
+            self._stale = True
+        UICollection.ensure_loaded(self)
+
+    def fetch(self):
+        collection = self.get_collection()
+        if collection is None:
+            return []
+        return collection.referring(self._field,
+                                    self._parent.get_entity().id)
+
+    def refresh(self, entities=None):
+        collection = self.get_collection()
+        if collection is not None:
+            collection.ensure_loaded()
+            self._joined_version = collection._version
+            entities = None
+        UICollection.refresh(self, entities)
+
+    def make_node(self, entity, parent=None):
+        return self.get_collection().make_node(entity, parent or self)
+
+    def entity_service(self, entity_id):
+        return self.get_collection().entity_service(entity_id)
+
+    def search(self, query):
+        entity_id = self._parent.get_entity().id
+        return [entity for entity in self.get_collection().search(query)
+                if getattr(entity, self._field) == entity_id]
+
+    def summary(self):
+        self.ensure_loaded()
+        return '%s: %d' % (self.name, len(self._nodes)), None
+
+
+class UIEntity(UINode):
+    '''
+    Base UI node for a single oVirt Engine object, child of a UICollection.
+    Nodes only keep a compact record of the object's displayed attributes,
+    as the SDK objects have all the attributes of their type: the whole
+    object is fetched again from oVirt Engine when needed.
+    '''
+    # Attributes of the object this node displays, all of them if None.
+    fields = None
+    # The objects of other collections linked to this one, listed by
+    # UIJoin children: (collection name, linking field) pairs.
+    joins = ()
+
+    def __init__(self, parent, entity, name):
+        UINode.__init__(self, name, parent)
+        self._entity = self.record(entity)
+        self.refresh()
+
+    @classmethod
+    def record(cls, entity):
+        '''
+        Returns the record of entity kept by the nodes of this class, or
+        entity itself if fields is None. See make_record().
+        '''
+        if cls.fields is None:
+            return entity
+        return make_record(entity, cls.fields)
+
+    def get_entity(self):
+        return self._entity
+
+    def get_collection(self):
+        return self._parent.get_collection()
+
+    def fetch_entity(self):
+        '''
+        Returns the whole object, fetched from oVirt Engine.
+        '''
+        return self._parent.entity_service(self._entity.id).get()
+
+    def update(self, entity):
+        '''
+        Replaces the object shown by this node, following renames.
+        '''
+        self._entity = self.record(entity)
+        if entity.name != self.name:
+            self.name = entity.name
+
+    def output_record(self):
+        # With the attributes the node keeps, SDK types as in snapshots.
+        from .snapshot import encode
+        record = UINode.output_record(self)
+        record['id'] = self._entity.id
+        for field in getattr(self._entity, '_fields', ()):
+            record.setdefault(field, encode(getattr(self._entity, field)))
+        return record
+
+    def ui_command_show(self):
+        '''
+        Displays the attributes of the object, fetched from oVirt Engine.
+        Linked objects are shown by name, or by id if they have none.
+        '''
+        entity = self.fetch_entity()
+        lines = []
+        for attr in sorted(vars(entity)):
+            name = attr.lstrip('_')
+            text = describe(getattr(entity, name, None))
+            if text:
+                lines.append('%s: %s' % (name, text))
+        self.shell.con.display('\n'.join(lines))
+
+    def refresh(self):
+        if not self.joins:
+            # Shared by all leaves, nodes of objects having no children.
+            self._children = no_children
+        elif not self._children:
+            for name, field in self.joins:
+                UIJoin(name, self, field)
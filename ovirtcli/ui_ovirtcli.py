@@ -18,14 +18,32 @@ import glob
 import os
 import re
 import stat
-import time
 
 import ovirtsdk4 as sdk
 import ovirtsdk4.types as types
 
 from configshell_fb import ExecutionError
 
-from .ui_node import UINode
+from .bulk import ThreadFuture
+from .jobs import Job
+from .top import run_top, sort_keys
+from .ui_node import UICollection, UIEntity
+
+default_page_size = 500
+
+# Host states ending a deployment.
+deployed_host_states = (
+    types.HostStatus.UP,
+    types.HostStatus.NON_OPERATIONAL,
+    types.HostStatus.INSTALL_FAILED,
+)
+
+def remove_later(service):
+    '''
+    Removes the object of an SDK service in the background, and returns
+    the future of the removal. See ThreadFuture.
+    '''
+    return ThreadFuture(service.remove)
 
 def human_to_bytes(hsize, kilo=1024):
     '''
@@ -78,6 +96,11 @@ def bytes_to_human(size):
             return "%3.1f%s" % (size, x)
         size /= kilo
 
+def size_or_none(size):
+    if size is None:
+        return 'unknown'
+    return bytes_to_human(size)
+
 def complete_path(path, stat_fn):
     filtered = []
     for entry in glob.glob(path + '*'):
@@ -91,178 +114,247 @@ def complete_path(path, stat_fn):
     return sorted(filtered,
                   key=lambda s: '~'+s if s.endswith('/') else s)
 
-class UIData_centers(UINode):
+class UIData_centers(UICollection):
     """
     The data centers container UI.
     """
+    event_attr = 'data_center'
+
     def __init__(self, parent, api):
-        UINode.__init__(self, 'Datacenters', parent)
+        UICollection.__init__(self, 'Datacenters', parent)
         self._dcs_service = api.system_service().data_centers_service()
-        self.refresh()
 
-    def refresh(self):
-        self._children = set([])
-        dcs = self._dcs_service.list()
-        if dcs is not None:
-            for dc in dcs:
-                UIData_center(self, dc, dc.name)
+    def fetch(self):
+        return self.cached(
+            lambda: self.list_records(self._dcs_service, UIData_center.fields))
+
+    def make_node(self, dc, parent=None):
+        return UIData_center(parent or self, dc, dc.name)
+
+    def entity_service(self, dc_id):
+        return self._dcs_service.data_center_service(dc_id)
+
+    def search(self, query):
+        return self.list_records(self._dcs_service, UIData_center.fields,
+                                 search=query)
 
     def summary(self):
-        dcs = self._dcs_service.list()
+        dcs = self.load_entities()
         return 'Data Centers: %d' % len(dcs), None
 
     def ui_command_create(self, name, description=None, local=False):
-        self._dcs_service.add(
+        dc = self._dcs_service.add(
             types.DataCenter(
                 name=name,
                 description=description if description is not None else '',
                 local=local,
             ),
         )
-        self.refresh()
+        self.update_entity(dc.id, dc)
 
     def ui_command_delete(self, name):
-        search_query = 'name=%s' % name
-        try:
-            dc = self._dcs_service.list(search=search_query)[0]
-        except:
-            self.shell.log.info('Data center %s not found. Check spelling' % name)
+        """
+        Removes data centers, concurrently when several are selected.
+
+        PARAMETERS
+        ==========
+
+        name
+        ----
+        A data center name, a comma separated list of names or glob
+        patterns, or a regular expression prefixed with 're:'.
+        The global 'bulk_concurrency' limits the parallel removals.
+        """
+        dcs = self.select(name, 'Data center %s not found. Check spelling')
+        if not dcs:
             return
 
-        dc_service = self._dcs_service.data_center_service(dc.id)
-        dc_service.remove()
-        self.refresh()
+        def remove(dc):
+            return remove_later(self._dcs_service.data_center_service(dc.id))
+
+        self.run_bulk(dcs, [remove], 'Removed %d of %d data centers.')
 
     def ui_command_rename(self, name, new_name):
-        search_query = 'name=%s' % name
-        try:
-            dc = self._dcs_service.list(search=search_query)[0]
-        except:
+        dc = self.find(name)
+        if dc is None:
             self.shell.log.info('Data center %s not found. Check spelling' % name)
             return
 
         dc_service = self._dcs_service.data_center_service(dc.id)
-        dc_service.update(
+        dc = dc_service.update(
             types.DataCenter(
                  name=new_name,
             ),
         )
+        self.update_entity(dc.id, dc)
 
 
-class UIData_center(UINode):
+class UIData_center(UIEntity):
     """
     A single data center object UI.
     """
-    def __init__(self, parent, data_center, name):
-        UINode.__init__(self, name, parent)
-        self._data_center = data_center
-        self._parent = parent
-        self.refresh()
-
-    def refresh(self):
-        self._children = set([])
+    fields = ('name',)
+    joins = (('Clusters', 'data_center_id'),)
 
     def summary(self):
-        return 'Data Center: %s' % self._data_center.name, None
+        return 'Data Center: %s' % self._entity.name, None
 
     def ui_command_delete(self):
-        self._parent.ui_command_delete(self._data_center.name)
+        self.get_collection().ui_command_delete(self._entity.name)
 
 
-class UIClusters(UINode):
+class UIClusters(UICollection):
     """
     A clusters UI.
     """
+    event_attr = 'cluster'
+
     def __init__(self, parent, api):
-        UINode.__init__(self, 'Clusters', parent)
+        UICollection.__init__(self, 'Clusters', parent)
         self._clusters_service = api.system_service().clusters_service()
-        self.refresh()
 
-    def refresh(self):
-        self._children = set([])
-        clusters = self._clusters_service.list()
-        if clusters is not None:
-            for cluster in clusters:
-                UICluster(self, cluster, cluster.name)
+    def fetch(self):
+        return self.cached(
+            lambda: self.list_records(self._clusters_service,
+                                      UICluster.fields))
+
+    def make_node(self, cluster, parent=None):
+        return UICluster(parent or self, cluster, cluster.name)
+
+    def entity_service(self, cluster_id):
+        return self._clusters_service.cluster_service(cluster_id)
+
+    def search(self, query):
+        return self.list_records(self._clusters_service, UICluster.fields,
+                                 search=query)
 
     def summary(self):
-        clusters = self._clusters_service.list()
+        clusters = self.load_entities()
         return 'Clusters: %d' % len(clusters), None
 
 
-class UICluster(UINode):
+class UICluster(UIEntity):
     """
     A single cluster UI
     """
-    def __init__(self, parent, cluster, name):
-        UINode.__init__(self, name, parent)
-        self._cluster = cluster
-        self.refresh()
-
-    def refresh(self):
-        self._children = set([])
+    fields = ('name', 'cpu.type', 'data_center.id')
+    joins = (('Hosts', 'cluster_id'),)
 
     def summary(self):
-        cpu = self._cluster.cpu
-        return 'Cluster:%s' % cpu.type, None
+        cpu_type = self._entity.cpu_type
+        if cpu_type is None:
+            return 'Cluster: no CPU type', None
+        return 'Cluster: %s' % cpu_type, None
 
 
-class UIStorage_domains(UINode):
+class UIStorage_domains(UICollection):
     """
     A Storage Domains UI.
     """
+    event_attr = 'storage_domain'
+    summary_attr = 'storage_domains'
+
     def __init__(self, parent, api):
-        UINode.__init__(self, 'Storagedomains', parent)
+        UICollection.__init__(self, 'Storagedomains', parent)
         self._sds_service = api.system_service().storage_domains_service()
-        self.refresh()
 
-    def refresh(self):
-        self._children = set([])
-        sds = self._sds_service.list()
-        if sds is not None:
-            for sd in sds:
-                UIStorage_domain(self, sd, sd.name)
+    def fetch(self):
+        return self.cached(
+            lambda: self.list_records(self._sds_service,
+                                      UIStorage_domain.fields))
+
+    def make_node(self, sd, parent=None):
+        return UIStorage_domain(parent or self, sd, sd.name)
+
+    def entity_service(self, sd_id):
+        return self._sds_service.storage_domain_service(sd_id)
+
+    def search(self, query):
+        return self.list_records(self._sds_service, UIStorage_domain.fields,
+                                 search=query)
 
     def summary(self):
-        sds = self._sds_service.list()
+        sds = self.loaded_entities()
+        if sds is None:
+            counts = self.count_active()
+            if counts is not None:
+                return 'Storage Domains: %d' % counts[0], None
+            sds = self.fetch()
         return 'Storage Domains: %d' % len(sds), None
 
-
-class UIStorage_domain(UINode):
+    def ui_command_details(self, name='*'):
+        """
+        Displays the capacity of storage domains, fetching them from oVirt
+        Engine with up to the global 'connections' requests in flight.
+
+        PARAMETERS
+        ==========
+
+        name
+        ----
+        A storage domain name, a comma separated list of names or glob
+        patterns, or a regular expression prefixed with 're:'. All the
+        storage domains by default.
+        """
+        def describe(sd):
+            if sd.available is None or sd.used is None:
+                return 'capacity unknown'
+            return 'used %s of %s, %s committed' % (
+                bytes_to_human(sd.used),
+                bytes_to_human(sd.available + sd.used),
+                size_or_none(sd.committed))
+
+        self.show_details(
+            name,
+            lambda sd: self._sds_service.storage_domain_service(
+                sd.id).get(wait=False),
+            describe)
+
+
+class UIStorage_domain(UIEntity):
     """
     A single storage domain UI object.
     """
-    def __init__(self, parent, sd, name):
-        UINode.__init__(self, name, parent)
-        self._sd = sd
-        self._parent = parent
-        self.refresh()
-
-    def refresh(self):
-        self._children = set([])
+    fields = ('name', 'type', 'status')
 
     def summary(self):
-        return 'type: %s, status: %s' % (self._sd.type, self._sd.status), None
+        sd = self._entity
+        return 'type: %s, status: %s' % (sd.type, sd.status), None
 
 
-class UIHosts(UINode):
+class UIHosts(UICollection):
     """
     A Hosts objects UI.
     """
+    event_attr = 'host'
+    summary_attr = 'hosts'
+
     def __init__(self, parent, api):
-        UINode.__init__(self, 'Hosts', parent)
+        UICollection.__init__(self, 'Hosts', parent)
         self._hosts_service = api.system_service().hosts_service()
-        self.refresh()
 
-    def refresh(self):
-        self._children = set([])
-        hosts = self._hosts_service.list()
-        if hosts is not None:
-            for host in hosts:
-                UIHost(self, host, host.name)
+    def fetch(self):
+        return self.cached(
+            lambda: self.list_records(self._hosts_service, UIHost.fields))
+
+    def make_node(self, host, parent=None):
+        return UIHost(parent or self, host, host.name)
+
+    def entity_service(self, host_id):
+        return self._hosts_service.host_service(host_id)
+
+    def search(self, query):
+        return self.list_records(self._hosts_service, UIHost.fields,
+                                 search=query)
 
     def summary(self):
-        hosts = self._hosts_service.list()
+        # Only list the hosts to count them if oVirt Engine does not.
+        hosts = self.loaded_entities()
+        if hosts is None:
+            counts = self.count_active()
+            if counts is not None and counts[1] is not None:
+                return '%d hosts (%d UP)' % counts, None
+            hosts = self.fetch()
         if hosts is None:
             return 'no hosts', None
         hosts_up = 0
@@ -271,7 +363,10 @@ class UIHosts(UINode):
                 hosts_up += 1
         return '%d hosts (%d UP)' % (len(hosts), hosts_up), None
 
-    def ui_command_create(self, name, address, password, cluster, description=None):
+    def deploy(self, name, address, password, cluster, description=None):
+        """
+        Adds a host, and tracks its deployment as a background job.
+        """
         host = self._hosts_service.add(
             types.Host(
                 name=name,
@@ -283,171 +378,511 @@ class UIHosts(UINode):
                 ),
             ),
         )
-        # Wait till the host is up:
+        self.update_entity(host.id, host)
+
+        root = self.get_root()
         host_service = self._hosts_service.host_service(host.id)
-        start_time = time.time()
-        timeout = 15 * 60
-        elapsed = False
-        while not elapsed:
-            time.sleep(5)
-            host = host_service.get()
-            if host.status == types.HostStatus.UP or host.status == types.HostStatus.NonOperational:
-                break
-            if (time.time() - start_time) > timeout:
-                elapsed = True
-                break
+        deployed = {}
 
-        if host.status == types.HostStatus.UP:
-            self.shell.log.info("Host was successfully added.")
-            self.refresh()
+        def poll():
+            host = host_service.get()
+            deployed['host'] = host
+            return host.status in deployed_host_states, str(host.status)
+
+        def on_done(job):
+            host = deployed.get('host')
+            if host is not None:
+                root.defer(lambda: self.update_entity(host.id, host))
+
+        return root.get_jobs().submit(Job('deploy host %s' % name, poll,
+                                          on_done))
+
+    def ui_command_create(self, name, address, password, cluster,
+                          description=None, wait='true'):
+        """
+        Adds a host, and waits for its deployment to be over unless wait is
+        false, in which case it is tracked in the background.
+
+        SEE ALSO
+        ========
+        B{bulkcreate} B{jobs}
+        """
+        wait = self.ui_eval_param(wait, 'bool', True)
+        job = self.deploy(name, address, password, cluster, description)
+        if not wait:
+            self.shell.log.info("Deploying host %s as job %d."
+                                % (name, job.id))
             return
 
-        if elapsed or host.status != types.HostStatus.UP:
-            self.shell.log.info("Host was not added properly. Status: %s" % host.status)
+        self.get_root().wait_jobs([job])
+        if job.status == str(types.HostStatus.UP):
+            self.shell.log.info("Host was successfully added.")
+        else:
+            self.shell.log.info("Host was not added properly. Status: %s"
+                                % job.status)
+
+    def ui_command_bulkcreate(self, hostsfile, cluster, password=None,
+                              wait='false'):
+        """
+        Adds many hosts at once, and tracks their deployments as background
+        jobs, all of them being polled concurrently.
+
+        PARAMETERS
+        ==========
+
+        hostsfile
+        ---------
+        A file with one host per line: its name, its address, and its root
+        password unless the password parameter is given, separated by
+        spaces. Empty lines and lines starting with '#' are skipped.
+
+        wait
+        ----
+        If true, waits for all the deployments to be over.
+
+        A host failing to be added does not stop the others: the hosts
+        being deployed and the ones that failed are both reported, the
+        command failing if any did.
+
+        SEE ALSO
+        ========
+        B{create} B{jobs}
+        """
+        wait = self.ui_eval_param(wait, 'bool', False)
+        hosts = []
+        with open(os.path.expanduser(hostsfile)) as hosts_file:
+            for line in hosts_file:
+                fields = line.split()
+                if not fields or fields[0].startswith('#'):
+                    continue
+                if password is not None:
+                    fields.append(password)
+                if len(fields) < 3:
+                    raise ExecutionError("Missing address or password: %s"
+                                         % line.strip())
+                hosts.append(fields[:3])
+
+        jobs = []
+        added = []
+        failed = []
+        for name, address, root_password in hosts:
+            try:
+                jobs.append(self.deploy(name, address, root_password, cluster))
+            except Exception as error:
+                self.shell.log.error('%s: %s' % (name, error))
+                failed.append(name)
+            else:
+                added.append(name)
+        if jobs:
+            self.shell.log.info("Deploying %d hosts as jobs %s: %s."
+                                % (len(jobs),
+                                   ', '.join(str(job.id) for job in jobs),
+                                   ', '.join(added)))
+        if wait and jobs:
+            self.get_root().wait_jobs(jobs)
+            up = [job for job in jobs
+                  if job.status == str(types.HostStatus.UP)]
+            self.shell.log.info("%d of %d hosts were successfully added."
+                                % (len(up), len(jobs)))
+        if failed:
+            raise ExecutionError("Failed to add %d of %d hosts: %s."
+                                 % (len(failed), len(hosts),
+                                    ', '.join(failed)))
+
+    def ui_complete_bulkcreate(self, parameters, text, current_param):
+        if current_param != 'hostsfile':
+            return []
+        completions = complete_path(text, stat.S_ISREG)
+        if len(completions) == 1 and not completions[0].endswith('/'):
+            completions = [completions[0] + ' ']
+        return completions
+
+    def get_later(self, host):
+        return self._hosts_service.host_service(host.id).get(wait=False)
 
     def ui_command_delete(self, name):
-        search_query = 'name=%s' % name
-        try:
-            host = self._hosts_service.list(search=search_query)[0]
-        except:
-            self.shell.log.info('Host %s not found. Check spelling.' % name)
+        """
+        Removes hosts, which must be in Maintenance, concurrently when
+        several are selected. Their status is read again from oVirt Engine
+        first, as the listed one may be outdated.
+
+        PARAMETERS
+        ==========
+
+        name
+        ----
+        A host name, a comma separated list of names or glob patterns,
+        such as host-rack3-*, or a regular expression prefixed with 're:'.
+        The global 'bulk_concurrency' limits the parallel removals.
+
+        SEE ALSO
+        ========
+        B{deactivate}
+        """
+        hosts = self.select_current(name, 'Host %s not found. Check spelling.')
+        removable = []
+        for host in hosts:
+            if host.status != types.HostStatus.MAINTENANCE:
+                self.shell.log.info('Host %s is not in Maintenance. '
+                                    'Deactivate it first.' % host.name)
+            else:
+                removable.append(host)
+        if not removable:
             return
 
-        host_service = self._hosts_service.host_service(host.id)
-        if host.status != types.HostStatus.MAINTENANCE:
-            self.shell.log.info('Host is not in Maintenance. Deactivate it first.')
-            return
+        def remove(host):
+            return remove_later(self._hosts_service.host_service(host.id))
 
-        host_service.remove()
-        self.refresh()
+        self.run_bulk(removable, [remove], 'Removed %d of %d hosts.')
 
     def ui_command_deactivate(self, name):
-        search_query = 'name=%s' % name
-        try:
-            host = self._hosts_service.list(search=search_query)[0]
-        except:
-            self.shell.log.info('Host %s not found. Check spelling' % name)
+        """
+        Moves hosts to Maintenance, concurrently when several are selected.
+        Hosts already in Maintenance, as read again from oVirt Engine, are
+        left alone.
+
+        PARAMETERS
+        ==========
+
+        name
+        ----
+        A host name, a comma separated list of names or glob patterns,
+        such as host-rack3-*, or a regular expression prefixed with 're:'.
+        The global 'bulk_concurrency' limits the parallel actions.
+
+        SEE ALSO
+        ========
+        B{activate} B{delete}
+        """
+        hosts = [host for host in
+                 self.select_current(name,
+                                     'Host %s not found. Check spelling')
+                 if host.status != types.HostStatus.MAINTENANCE]
+        if not hosts:
             return
 
-        host_service = self._hosts_service.host_service(host.id)
-        if host.status != types.HostStatus.MAINTENANCE:
-            host_service.deactivate()
-            self.refresh()
+        def deactivate(host):
+            return self._hosts_service.host_service(host.id).deactivate(
+                wait=False)
+
+        self.run_bulk(hosts, [deactivate, self.get_later],
+                      'Deactivated %d of %d hosts.')
 
     def ui_command_activate(self, name):
-        search_query = 'name=%s' % name
-        try:
-            host = self._hosts_service.list(search=search_query)[0]
-        except:
-            self.shell.log.info('Host %s not found. Check spelling' % name)
+        """
+        Activates hosts, concurrently when several are selected. Hosts
+        already UP, as read again from oVirt Engine, are left alone.
+
+        PARAMETERS
+        ==========
+
+        name
+        ----
+        A host name, a comma separated list of names or glob patterns,
+        such as host-rack3-*, or a regular expression prefixed with 're:'.
+        The global 'bulk_concurrency' limits the parallel actions.
+
+        SEE ALSO
+        ========
+        B{deactivate}
+        """
+        hosts = [host for host in
+                 self.select_current(name,
+                                     'Host %s not found. Check spelling')
+                 if host.status != types.HostStatus.UP]
+        if not hosts:
             return
 
-        host_service = self._hosts_service.host_service(host.id)
-        if host.status != types.HostStatus.UP:
-            host_service.activate()
-            self.refresh()
-
-
-class UIHost(UINode):
+        def activate(host):
+            return self._hosts_service.host_service(host.id).activate(
+                wait=False)
+
+        self.run_bulk(hosts, [activate, self.get_later],
+                      'Activated %d of %d hosts.')
+
+    def ui_command_details(self, name='*'):
+        """
+        Displays the network interfaces of hosts, fetching them from oVirt
+        Engine with up to the global 'connections' requests in flight.
+
+        PARAMETERS
+        ==========
+
+        name
+        ----
+        A host name, a comma separated list of names or glob patterns, or a
+        regular expression prefixed with 're:'. All the hosts by default.
+        """
+        def describe(nics):
+            return ', '.join('%s%s [%s]' % (
+                nic.name, ' %s' % nic.ip.address if nic.ip is not None else '',
+                nic.status) for nic in nics) or 'no NICs'
+
+        self.show_details(
+            name,
+            lambda host: self._hosts_service.host_service(
+                host.id).nics_service().list(wait=False),
+            describe)
+
+    def ui_command_top(self, name='*', interval=None, sort='cpu', rows=None,
+                       iterations=None):
+        """
+        Monitors the CPU, memory and network use of the hosts that are up,
+        polling their statistics concurrently, with up to the global
+        'connections' requests in flight, and redrawing the busiest ones
+        in place until interrupted with Ctrl-C.
+
+        PARAMETERS
+        ==========
+
+        name
+        ----
+        A host name, a comma separated list of names or glob patterns, or a
+        regular expression prefixed with 're:'. All the hosts by default.
+
+        interval
+        --------
+        Number of seconds between polls, at least 1, 5 by default.
+
+        sort
+        ----
+        What to sort the hosts by, highest first: cpu (the default),
+        memory, network, or name.
+
+        rows
+        ----
+        Number of hosts shown, 20 by default.
+
+        iterations
+        ----------
+        Number of polls before returning, 0 for no limit. The default is no
+        limit on a terminal, a single poll otherwise.
+
+        SEE ALSO
+        ========
+        B{details}
+        """
+        run_top(self, name, interval, sort, rows, iterations,
+                lambda host: self._hosts_service.host_service(host.id),
+                lambda host: host.status == types.HostStatus.UP)
+
+    def ui_complete_top(self, parameters, text, current_param):
+        if current_param != 'sort':
+            return []
+        return [key for key in sort_keys if key.startswith(text)]
+
+
+class UIHost(UIEntity):
     """
     A single host object UI.
     """
-    def __init__(self, parent, host, name):
-        UINode.__init__(self, name, parent)
-        self._host = host
-        self._parent = parent
-        self.refresh()
-
-    def refresh(self):
-        self._children = set([])
+    fields = ('name', 'address', 'status', 'cluster.id')
 
     def summary(self):
-        status = self._host.status
+        status = self._entity.status
         if status == types.HostStatus.UP:
             state = ' [UP]'
         elif status == types.HostStatus.MAINTENANCE:
             state = ' [Maint.]'
         else:
             state = ''
-        return 'Address: %s%s' % (self._host.address, state), None
+        return 'Address: %s%s' % (self._entity.address, state), None
 
     def ui_command_deactivate(self):
-        self._parent.ui_command_deactivate(self._host.name)
+        self.get_collection().ui_command_deactivate(self._entity.name)
         self.refresh()
 
     def ui_command_activate(self):
-        self._parent.ui_command_activate(self._host.name)
+        self.get_collection().ui_command_activate(self._entity.name)
         self.refresh()
 
 
-class UIVMs(UINode):
+class UIVMs(UICollection):
     """
     A VMs objects UI.
+    VMs are fetched in pages of the global 'page_size', so that large
+    inventories can be listed while they are being downloaded.
     """
+    event_attr = 'vm'
+    summary_attr = 'vms'
+    paged = True
+
     def __init__(self, parent, api):
-        UINode.__init__(self, 'VMs', parent)
+        UICollection.__init__(self, 'VMs', parent)
         self._vms_service = api.system_service().vms_service()
-        self.refresh()
 
-    def refresh(self):
-        self._children = set([])
-        vms = self._vms_service.list()
-        # for vm in vms:
-        #    UIVM(self, vm)
+    def iter_pages(self):
+        page_size = self.shell.prefs['page_size'] or default_page_size
+        page = 1
+        while True:
+            vms = self.list_records(
+                self._vms_service,
+                UIVM.fields,
+                search='sortby name asc page %d' % page,
+                max=page_size,
+            )
+            if vms:
+                yield vms
+            if len(vms) < page_size:
+                break
+            page += 1
+
+    def fetch(self):
+        def list_all():
+            vms = []
+            for page in self.iter_pages():
+                vms.extend(page)
+            return vms
+        return self.cached(list_all)
+
+    def make_node(self, vm, parent=None):
+        return UIVM(parent or self, vm, vm.name)
+
+    def entity_service(self, vm_id):
+        return self._vms_service.vm_service(vm_id)
+
+    def search(self, query):
+        return self.list_records(self._vms_service, UIVM.fields, search=query)
 
     def summary(self):
-        vms = self._vms_service.list()
+        if self._loading:
+            return 'Virtual Machines: loading', None
+        if self._populated:
+            return 'Virtual Machines: %d' % len(self._nodes), None
+        counts = self.count_active()
+        if counts is not None:
+            return 'Virtual Machines: %d' % counts[0], None
+        vms = self.fetch()
         num_vms = len(vms)
 
         return 'Virtual Machines: %d' % num_vms, None
 
-class UIVM(UINode):
+    def ui_command_details(self, name='*'):
+        """
+        Displays the disks of virtual machines, fetching them from oVirt
+        Engine with up to the global 'connections' requests in flight.
+
+        PARAMETERS
+        ==========
+
+        name
+        ----
+        A virtual machine name, a comma separated list of names or glob
+        patterns, or a regular expression prefixed with 're:'. All the
+        virtual machines by default.
+        """
+        def describe(attachments):
+            disks = [attachment.disk for attachment in attachments
+                     if attachment.disk is not None]
+            return '%d disks, %s provisioned, %s used' % (
+                len(disks),
+                bytes_to_human(sum(disk.provisioned_size or 0
+                                   for disk in disks)),
+                bytes_to_human(sum(disk.actual_size or 0 for disk in disks)))
+
+        self.show_details(
+            name,
+            lambda vm: self._vms_service.vm_service(
+                vm.id).disk_attachments_service().list(follow='disk',
+                                                       wait=False),
+            describe)
+
+    def ui_command_top(self, name='*', interval=None, sort='cpu', rows=None,
+                       iterations=None):
+        """
+        Monitors the CPU, memory and network use of the virtual machines
+        that are up, polling their statistics concurrently, with up to the
+        global 'connections' requests in flight, and redrawing the busiest
+        ones in place until interrupted with Ctrl-C.
+
+        PARAMETERS
+        ==========
+
+        name
+        ----
+        A virtual machine name, a comma separated list of names or glob
+        patterns, or a regular expression prefixed with 're:'. All the
+        virtual machines by default: polling them all takes two requests
+        per virtual machine that is up.
+
+        interval
+        --------
+        Number of seconds between polls, at least 1, 5 by default.
+
+        sort
+        ----
+        What to sort the virtual machines by, highest first: cpu (the
+        default), memory, network, or name.
+
+        rows
+        ----
+        Number of virtual machines shown, 20 by default.
+
+        iterations
+        ----------
+        Number of polls before returning, 0 for no limit. The default is no
+        limit on a terminal, a single poll otherwise.
+
+        SEE ALSO
+        ========
+        B{details}
+        """
+        run_top(self, name, interval, sort, rows, iterations,
+                lambda vm: self._vms_service.vm_service(vm.id),
+                lambda vm: vm.status == types.VmStatus.UP)
+
+    def ui_complete_top(self, parameters, text, current_param):
+        if current_param != 'sort':
+            return []
+        return [key for key in sort_keys if key.startswith(text)]
+
+
+class UIVM(UIEntity):
     """
     A single VM object UI.
     """
-    def __init__(self, parent, vm):
-        UINode.__init__(self, 'Virtual machine', parent)
-        self._vm = vm
-        self.refresh()
-
-    def refresh(self):
-        self._children = set([])
+    fields = ('name', 'status')
 
     def summary(self):
-        return '%s:%s' % (self._vm.name, self._vm.id), None
+        vm = self._entity
+        return 'ID: %s [%s]' % (vm.id, vm.status), None
 
 
-class UITemplates(UINode):
+class UITemplates(UICollection):
     """
     A Templates UI.
     """
+    event_attr = 'template'
+
     def __init__(self, parent, api):
-        UINode.__init__(self, 'Templates', parent)
+        UICollection.__init__(self, 'Templates', parent)
         self._templates_service = api.system_service().templates_service()
-        self.refresh()
 
-    def refresh(self):
-        self._children = set([])
-        templates = self._templates_service.list()
-        for template in templates:
-            UITemplate(self, template, template.name)
+    def fetch(self):
+        return self.cached(
+            lambda: self.list_records(self._templates_service,
+                                      UITemplate.fields))
+
+    def make_node(self, template, parent=None):
+        return UITemplate(parent or self, template, template.name)
+
+    def entity_service(self, template_id):
+        return self._templates_service.template_service(template_id)
+
+    def search(self, query):
+        return self.list_records(self._templates_service, UITemplate.fields,
+                                 search=query)
 
     def summary(self):
-        templates = self._templates_service.list()
+        templates = self.load_entities()
         return 'Templates: %d' % len(templates), None
 
 
-class UITemplate(UINode):
+class UITemplate(UIEntity):
     """
     A single template object UI.
     """
-    def __init__(self, parent, template, name):
-        UINode.__init__(self, name, parent)
-        self._template = template
-        self.refresh()
-
-    def refresh(self):
-        self._children = set([])
+    fields = ('name',)
 
     def summary(self):
-        return '%s' % self._template.name, None
+        return '%s' % self._entity.name, None
@@ -15,25 +15,36 @@ under the License.
 """
 
 import os
+import re
 import shutil
 import stat
+from collections import deque
 from datetime import datetime
 from glob import glob
 
-import ovirtsdk4 as sdk
-
 from configshell_fb import ExecutionError
 
-from .ui_node import UINode
+from .autorefresh import AutoRefresher
+from .jobs import JobManager
+from .refresh import interleave, map_concurrently, refresh_nodes
+from .snapshot import SnapshotReader, diff_rows, encode, merge_by_key, \
+    write_snapshot
+from .stats import latency_buckets, request_stats
+from .ui_engine import UIEngine, ui_ovirtcli
 
-from .ui_ovirtcli import UIData_centers, UIClusters, UIStorage_domains, UITemplates, UIVMs, UIHosts
+# The SDK and the collection UIs take most of the startup time, so they are
+# only imported once needed, that is once connected: see ui_ovirtcli().
 
-default_save_file = "~/ovirtlcli.json"
+default_save_file = "~/.ovirtcli/snapshot.jsonl.gz"
 kept_backups = 10
+# Number of differences displayed at once by diff.
+diff_batch = 1000
+# Engine names are lower case, so that they never clash with collections.
+engine_name = re.compile(r'^[a-z0-9][a-z0-9_.\-]*$')
 
 def complete_path(path, stat_fn):
     filtered = []
-    for entry in glob.glob(path + '*'):
+    for entry in glob(path + '*'):
         st = os.stat(entry)
         if stat.S_ISDIR(st.st_mode):
             filtered.append(entry + '/')
@@ -45,102 +56,456 @@ def complete_path(path, stat_fn):
                   key=lambda s: '~'+s if s.endswith('/') else s)
 
 
-class UIRoot(UINode):
+class UIRoot(UIEngine):
     """
-    The ovirt4cli hierarchy root node.
+    The ovirt4cli hierarchy root node, and the default engine. The engines
+    connected with a name are its children.
     """
 
     def __init__(self, shell, as_admin=True):
-        UINode.__init__(self, '/', shell=shell)
+        UIEngine.__init__(self, '/', shell=shell)
         self.as_admin = as_admin
-        self._api = None
-        self._ip = None
+        self._jobs = None
+        self._refresher = None
+        self._deferred = deque()
 
-    def refresh(self):
+    def defer(self, callback):
         """
-        Refreshes the tree of oVirt modules.
+        Schedules callback to be called from the main thread before the next
+        command runs. Background threads use it to update the tree.
         """
-        self._children = set([])
+        self._deferred.append(callback)
 
-        if self._api is not None:
-            UIData_centers(self, self._api)
-            # FIXME
-            # UIClusters(self, self._api)
-            UIHosts(self, self._api)
-            UIStorage_domains(self, self._api)
-            UITemplates(self, self._api)
-            UIVMs(self, self._api)
+    def run_deferred(self):
+        """
+        Calls the callbacks scheduled with defer().
+        """
+        while self._deferred:
+            self._deferred.popleft()()
+
+    def update_refresher(self):
+        '''
+        Tells the auto refresher what to keep current after a command: the
+        engine entry points every global 'auto_refresh' seconds, and the
+        loaded collections at their own interval, see
+        ui_command_autorefresh(). Starts or stops it as needed.
+        '''
+        interval = self.shell.prefs['auto_refresh'] or 0
+        engines = [engine for engine in self.get_engines()
+                   if engine._api is not None]
+        if interval <= 0 or not engines:
+            self._stop_refresher()
+            return
+        intervals = self.shell.prefs['auto_refresh_intervals'] or {}
+        targets = []
+        for engine in engines:
+            targets.append((engine, interval, None))
+            for collection in engine.get_collections():
+                seconds = intervals.get(collection.path, interval)
+                if seconds > 0 and collection.is_populated():
+                    targets.append((collection, seconds,
+                                    collection._version))
+        if self._refresher is None:
+            self._refresher = AutoRefresher(self.defer, self.shell.log)
+        self._refresher.schedule(targets)
+
+    def _stop_refresher(self):
+        if self._refresher is not None:
+            self._refresher.stop()
+            self._refresher = None
+
+    def get_jobs(self):
+        return self._jobs
+
+    def wait_jobs(self, jobs=None, timeout=None):
+        """
+        Waits for background jobs to be over and applies their results.
+        Returns True if they are all over.
+        """
+        done = self._jobs.wait(jobs, timeout)
+        self.run_deferred()
+        return done
+
+    def get_engines(self):
+        '''
+        Returns the default engine, that is the root, and the named ones.
+        '''
+        return [self] + sorted([child for child in self._children
+                                if child.is_engine],
+                               key=lambda engine: engine.name)
+
+    def is_connected(self):
+        return any(engine._api is not None for engine in self.get_engines())
+
+    def flush_cache(self):
+        for engine in self.get_engines():
+            UIEngine.flush_cache(engine)
+
+    def refresh(self):
+        '''
+        Refreshes the tree of oVirt modules of all the engines. They are
+        polled, then their collections fetched, concurrently, so that this
+        takes about as long as refreshing the slowest one.
+        '''
+        engines = self.get_engines()
+        polled = map_concurrently(lambda engine: engine.poll(), engines,
+                                  len(engines))
+        collections = interleave([engine.rebuild(incremental)
+                                  for engine, incremental
+                                  in zip(engines, polled)])
+        if collections and not self.shell.prefs['lazy_refresh']:
+            refresh_nodes(collections, self.fetch_concurrency(engines))
 
     def summary(self):
-        if self._api is None:
-            return "Disconnected", None
-        info = self._api.system_service().get()
-        return "Engine %s: %s" % (self._ip, info.product_info.version.full_version), None
+        if self._api is None and len(self.get_engines()) > 1:
+            return "Engines: %d" % (len(self.get_engines()) - 1), None
+        return UIEngine.summary(self)
 
-    def ui_command_connect(self, username, password, ip):
+    def ui_command_status(self, format=None):
+        '''
+        Displays the status summary of each connected engine, read
+        concurrently, and the total numbers of hosts and virtual machines
+        of all of them.
+
+        PARAMETERS
+        ==========
+
+        format
+        ------
+        text, json or csv, defaults to the global 'output_format'. Each
+        engine is then written as a record, with its numbers of hosts and
+        virtual machines in JSON, followed by their total if several.
+
+        SEE ALSO
+        ========
+        B{ls}
+        '''
+        engines = [engine for engine in self.get_engines()
+                   if engine._api is not None]
+        if engines in ([], [self]):
+            return UIEngine.ui_command_status(self, format)
+
+        output_format = self.get_output_format(format)
+        infos = map_concurrently(lambda engine: engine.get_api_info(),
+                                 engines, len(engines))
+        records = []
+        totals = {}
+        for engine, info in zip(engines, infos):
+            description = engine.describe(info)
+            record = {'path': engine.path,
+                      'kind': type(engine).__name__.replace('UI', '', 1),
+                      'name': engine.name, 'summary': description}
+            if output_format == 'text':
+                self.shell.log.info("Status for %s: %s"
+                                    % (engine.path, description))
+            for attr in ('hosts', 'vms'):
+                counts = info.summary and getattr(info.summary, attr, None)
+                total, active = totals.get(attr, (0, 0))
+                if counts is not None:
+                    record[attr] = counts.total
+                    record['%s_active' % attr] = counts.active
+                    total += counts.total or 0
+                    active += counts.active or 0
+                totals[attr] = total, active
+            records.append(record)
+        description = ("Total for %d engines: %d hosts (%d UP), "
+                       "%d virtual machines (%d up)"
+                       % ((len(engines),) + totals['hosts'] + totals['vms']))
+        if output_format != 'text':
+            if len(engines) > 1:
+                records.append({'path': self.path, 'kind': 'Total',
+                                'name': self.name, 'summary': description,
+                                'hosts': totals['hosts'][0],
+                                'hosts_active': totals['hosts'][1],
+                                'vms': totals['vms'][0],
+                                'vms_active': totals['vms'][1]})
+            self.write_records(output_format, records)
+        elif len(engines) > 1:
+            self.shell.log.info(description)
+
+    def ui_command_connect(self, username, password, ip, name=None):
         """
-        Connect to oVirt Engine
+        Connect to oVirt Engine. Unless the token_cache global is off, the
+        SSO token is kept under the preferences directory and reused by the
+        next connections of the same user to the same engine.
+        Several engines can be connected to at once, giving each but the
+        default one a name: its objects are then listed under /name, and
+        refresh, status and ls query all the engines concurrently.
         :param username: the username used to connect
         :param password: the password used to connect
-        :param url: the host name of the oVirt engine
+        :param ip: the host name of the oVirt engine, or its base URL, such
+        as http://localhost:8080
+        :param name: the name of the engine, made of lower case letters,
+        digits, '_', '.' and '-', or none for the default engine
         :return: None
         """
+        if name is None:
+            self.connect(username, password, ip)
+        else:
+            if not engine_name.match(name):
+                raise ExecutionError("Invalid engine name %s" % name)
+            if name in [child.name for child in self._children]:
+                raise ExecutionError("Already connected to %s. "
+                                     "Disconnect first" % name)
+            engine = UIEngine(name, self)
+            try:
+                engine.connect(username, password, ip)
+            except:
+                self.remove_child(engine)
+                raise
+        if self._jobs is None:
+            self._jobs = JobManager(self.shell.log)
+
+    def remove_engine(self, engine):
+        '''
+        Disconnects from a named engine and removes its node. Returns the
+        root node if the current one was below it, for the shell to go
+        there.
+        '''
+        engine.disconnect()
+        engine.parent.remove_child(engine)
+        if not self.is_connected():
+            self._stop_jobs()
+        node = self.shell._current_node
+        while node is not None and node is not engine:
+            node = node.parent
+        if node is not None:
+            return self
+
+    def _stop_jobs(self):
+        self._stop_refresher()
+        if self._jobs is not None:
+            self._jobs.stop()
+            self._jobs = None
+            self._deferred.clear()
+
+    def ui_command_disconnect(self, name=None):
+        '''
+        Disconnects from oVirt Engine: from the one given by name, or from
+        all of them.
 
+        SEE ALSO
+        ========
+        B{connect}
+        '''
+        if name is not None:
+            engines = [engine for engine in self.get_engines()[1:]
+                       if engine.name == name]
+            if not engines:
+                raise ExecutionError("Not connected to %s" % name)
+            return self.remove_engine(engines[0])
+
+        result = None
+        named = self.get_engines()[1:]
+        for engine in named:
+            result = self.remove_engine(engine) or result
         if self._api is not None:
-            self.shell.log.info("Already connected. Disconnect first")
+            self.disconnect()
+        elif not named:
+            self.shell.log.info('Already disconnected from oVirt Engine.')
+        self._stop_jobs()
+        self.refresh()
+        return result
+
+    def ui_complete_disconnect(self, parameters, text, current_param):
+        if current_param != 'name':
+            return []
+        return [engine.name for engine in self.get_engines()[1:]
+                if engine.name.startswith(text)]
+
+    def ui_command_jobs(self, action='list', job=None, timeout=None):
+        '''
+        Lists or waits for the operations running in the background, such
+        as host deployments.
 
-        full_url = 'https://%s/ovirt-engine/api' % ip
+        PARAMETERS
+        ==========
 
-        self.shell.log.info("Connecting to %s..." % ip)
+        action
+        ------
+        Either 'list' (the default), 'wait' to block until the job, or all
+        pending jobs, are over, or 'clear' to forget the jobs that are over.
 
-        self._api = sdk.Connection(
-            url=full_url,
-            username=username,
-            password=password,
-            insecure=True,
-        )
+        job
+        ---
+        The id of the job to wait for.
 
-        if self._api is None:
-            self.shell.log.info("Failed to create API object ")
-            return False
+        timeout
+        -------
+        Maximum number of seconds to wait for.
+        '''
+        if self._jobs is None:
+            self.shell.log.info("Not connected, no jobs.")
+            return
 
-        if not self._api.test(raise_exception=False):
-            self.shell.log.info("Failed to test connection to oVirt Engine.")
-            self._api = None
+        if action == 'list':
+            for item in self._jobs.jobs():
+                line = "%d: %s [%s] %ds" % (item.id, item.description,
+                                            item.status, item.elapsed())
+                if item.error:
+                    line += " (%s)" % item.error
+                self.shell.con.display(line)
+        elif action == 'wait':
+            jobs = None
+            if job is not None:
+                item = self._jobs.get(self.ui_eval_param(job, 'number', None))
+                if item is None:
+                    raise ExecutionError("No such job %s" % job)
+                jobs = [item]
+            timeout = self.ui_eval_param(timeout, 'number', None)
+            if not self.wait_jobs(jobs, timeout):
+                self.shell.log.info("Timed out, jobs still running.")
+        elif action == 'clear':
+            self._jobs.clear()
         else:
-            self.shell.log.info("Connected to oVirt Engine.")
-            self._ip = ip
-            self.refresh()
+            raise ExecutionError("Unknown jobs action %s" % action)
 
-    def ui_command_disconnect(self):
-        if self._api is not None:
-            self._api.close()
-            self._api = None
-            self._ip = None
-            self.shell.log.info('Disconnected from oVirt Engine.')
+    def ui_complete_jobs(self, parameters, text, current_param):
+        if current_param != 'action':
+            return []
+        return [action for action in ('list', 'wait', 'clear')
+                if action.startswith(text)]
+
+    def ui_command_stats(self, action='show', tracefile=None):
+        '''
+        Displays the requests sent to oVirt Engine: per resource, their
+        number, latencies and received bytes, and per command, how many
+        requests it sent and how many of them were redundant, that is for an
+        URL the same command already requested.
+
+        PARAMETERS
+        ==========
+
+        action
+        ------
+        Either 'show' (the default), 'reset' to zero the counters, or
+        'trace' to log each request to tracefile, or to stop logging them
+        if tracefile is not given.
+
+        tracefile
+        ---------
+        The file requests are appended to.
+
+        SEE ALSO
+        ========
+        B{cache}
+        '''
+        if action == 'reset':
+            request_stats.reset()
+            self.shell.log.info("Request counters reset.")
+        elif action == 'trace':
+            try:
+                request_stats.trace(tracefile and os.path.expanduser(tracefile))
+            except IOError as error:
+                raise ExecutionError("Cannot trace to %s: %s"
+                                     % (tracefile, error))
+            if tracefile:
+                self.shell.log.info("Tracing requests to %s." % tracefile)
+            else:
+                self.shell.log.info("Stopped tracing requests.")
+        elif action == 'show':
+            bytes_to_human = ui_ovirtcli().bytes_to_human
+            buckets = ['<%dms' % bound for bound in latency_buckets]
+            buckets.append('>=%dms' % latency_buckets[-1])
+            self.shell.con.display(
+                "%-30s %6s %8s %8s %10s  %s"
+                % ('resource', 'count', 'avg ms', 'max ms', 'received',
+                   ' '.join('%7s' % bucket for bucket in buckets)))
+            for resource, stats in request_stats.resources():
+                line = "%-30s %6d %8.1f %8.1f %10s  %s" % (
+                    resource, stats.count, stats.total * 1000 / stats.count,
+                    stats.max * 1000, bytes_to_human(stats.bytes),
+                    ' '.join('%7d' % count for count in stats.histogram))
+                if stats.errors:
+                    line += " (%d failed)" % stats.errors
+                self.shell.con.display(line)
+            self.shell.con.display("")
+            self.shell.con.display("%-30s %6s %8s %9s %9s"
+                                   % ('command', 'runs', 'requests',
+                                      'redundant', 'time'))
+            for origin, stats in request_stats.origins():
+                self.shell.con.display("%-30s %6d %8d %9d %8.3fs"
+                                       % (origin, stats.runs, stats.count,
+                                          stats.redundant, stats.total))
+            if request_stats.tracing():
+                self.shell.con.display("Tracing requests to %s."
+                                       % request_stats.tracing())
         else:
-            self.shell.log.info('Already disconnected from oVirt Engine.')
-        self.refresh()
+            raise ExecutionError("Unknown stats action %s" % action)
+
+    def ui_complete_stats(self, parameters, text, current_param):
+        if current_param == 'action':
+            return [action for action in ('show', 'reset', 'trace')
+                    if action.startswith(text)]
+        if current_param == 'tracefile':
+            completions = complete_path(text, stat.S_ISREG)
+            if len(completions) == 1 and not completions[0].endswith('/'):
+                completions = [completions[0] + ' ']
+            return completions
+        return []
+
+    def loaded_collections(self):
+        '''
+        Returns the collections of the connected engines that are loaded or
+        cached, as (path, type name, records) tuples sorted by path, the
+        order of the collections of snapshots.
+        '''
+        collections = []
+        for engine in self.get_engines():
+            if engine._api is None:
+                continue
+            for collection in engine.get_collections():
+                entities = collection.loaded_entities()
+                if entities is not None:
+                    collections.append((collection.path,
+                                        type(collection).__name__,
+                                        entities))
+        return sorted(collections, key=lambda collection: collection[0])
 
     def ui_command_saveconfig(self, savefile=default_save_file):
         """
-        Saves the current configuration to a file so that it can be restored
-        on next boot.
+        Saves the objects of the connected engines loaded so far to a
+        snapshot file, which restoreconfig loads back as a read-only tree,
+        without connecting. Browse them first, such as with 'ls /', to save
+        all of them. The file is a JSON lines file, compressed if its name
+        ends with '.gz'.
+
+        PARAMETERS
+        ==========
+
+        savefile
+        --------
+        The file to save the objects to. The last saves to the default
+        file are kept in the backup directory next to it.
+
+        SEE ALSO
+        ========
+        B{restoreconfig}
         """
+        collections = self.loaded_collections()
+        if not collections:
+            self.shell.log.info("No objects loaded, nothing to save.")
+            return
 
         savefile = os.path.expanduser(savefile)
 
         # Only save backups if saving to default location
-        if savefile == default_save_file:
-            backup_dir = os.path.dirname(savefile) + "/backup"
-            backup_name = "saveconfig-" + \
-                          datetime.now().strftime("%Y%m%d-%H:%M:%S") + ".json"
-            backupfile = backup_dir + "/" + backup_name
-            with ignored(IOError):
-                shutil.copy(savefile, backupfile)
+        if savefile == os.path.expanduser(default_save_file) \
+           and os.path.exists(savefile):
+            backup_dir = os.path.join(os.path.dirname(savefile), "backup")
+            extension = os.path.basename(savefile).partition('.')[2]
+            backup_name = "saveconfig-%s.%s" % (
+                datetime.now().strftime("%Y%m%d-%H%M%S"), extension)
+            try:
+                if not os.path.isdir(backup_dir):
+                    os.makedirs(backup_dir)
+                shutil.copy(savefile, os.path.join(backup_dir, backup_name))
+            except (IOError, OSError) as error:
+                self.shell.log.warning("Failed to back up %s: %s"
+                                       % (savefile, error))
 
             # Kill excess backups
-            backups = sorted(glob(os.path.dirname(savefile) + "/backup/*.json"))
+            backups = sorted(glob(os.path.join(backup_dir, "saveconfig-*")))
             files_to_unlink = list(reversed(backups))[kept_backups:]
             for f in files_to_unlink:
                 os.unlink(f)
@@ -148,33 +513,186 @@ class UIRoot(UINode):
             self.shell.log.info("Last %d configs saved in %s." % \
                                 (kept_backups, backup_dir))
 
-        # self.rtsroot.save_to_file(savefile)
+        header = {
+            'time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            'engines': dict((engine.path, engine._ip)
+                            for engine in self.get_engines()
+                            if engine._api is not None),
+        }
+        try:
+            written = write_snapshot(savefile, header, collections)
+        except (IOError, OSError) as error:
+            raise ExecutionError("Cannot save to %s: %s" % (savefile, error))
+
+        self.shell.log.info("Configuration saved to %s (%d objects)."
+                            % (savefile, written))
+
+    def ui_command_restoreconfig(self, savefile=default_save_file,
+                                 name='snapshot', clear_existing=None):
+        '''
+        Loads a snapshot file written by saveconfig as a read-only tree
+        under /name, to browse the objects it has without connecting.
+        The engines the snapshot has objects of are listed under it the
+        same way as when it was saved.
 
-        self.shell.log.info("Configuration saved to %s" % savefile)
+        PARAMETERS
+        ==========
 
-    def ui_command_restoreconfig(self, savefile=default_save_file, clear_existing=False):
-        '''
-        Restores configuration from a file.
-        '''
-        self.assert_admin()
+        savefile
+        --------
+        The snapshot file to load.
 
+        name
+        ----
+        The name of the tree of the snapshot.
+
+        clear_existing
+        --------------
+        If true, replaces the snapshot already loaded with the same name.
+
+        SEE ALSO
+        ========
+        B{saveconfig} B{disconnect}
+        '''
         savefile = os.path.expanduser(savefile)
+        clear_existing = self.ui_eval_param(clear_existing, 'bool', False)
 
         if not os.path.isfile(savefile):
             self.shell.log.info("Restore file %s not found" % savefile)
             return
 
-        # errors = self.rtsroot.restore_from_file(savefile, clear_existing)
-
-        self.refresh()
-
-        if errors:
-            raise ExecutionError("Configuration restored, %d recoverable errors:\n%s" % \
-                                 (len(errors), "\n".join(errors)))
-
-        self.shell.log.info("Configuration restored from %s" % savefile)
-
-    def ui_complete_saveconfig(self, text, current_param):
+        if not engine_name.match(name):
+            raise ExecutionError("Invalid snapshot name %s" % name)
+        existing = [engine for engine in self.get_engines()[1:]
+                    if engine.name == name]
+        if existing:
+            if not clear_existing or existing[0]._api is not None:
+                raise ExecutionError("%s is already loaded" % existing[0].path)
+            self.remove_engine(existing[0])
+
+        from .ui_snapshot import load_snapshot
+        try:
+            snapshot, count = load_snapshot(self, name, savefile)
+        except (IOError, OSError, ValueError, KeyError) as error:
+            raise ExecutionError("Cannot restore from %s: %s"
+                                 % (savefile, error))
+
+        self.shell.log.info("Configuration restored from %s to %s "
+                            "(%d objects)." % (savefile, snapshot.path, count))
+
+    def ui_command_diff(self, old, new=None):
+        '''
+        Compares two snapshot files written by saveconfig, or a snapshot
+        file with the objects of the connected engines loaded so far, and
+        lists the objects that were added (+), removed (-) or changed (~),
+        per collection. Snapshots are sorted by object id, so they are
+        compared as they are read rather than loaded.
+
+        PARAMETERS
+        ==========
+
+        old
+        ---
+        The snapshot file to compare from.
+
+        new
+        ---
+        The snapshot file to compare with, or if not given, the objects of
+        the connected engines, skipping the collections not loaded yet.
+
+        SEE ALSO
+        ========
+        B{saveconfig} B{restoreconfig}
+        '''
+        readers = []
+        try:
+            try:
+                readers.append(SnapshotReader(os.path.expanduser(old),
+                                              decode=False))
+                old_collections = readers[-1].collections()
+                if new is not None:
+                    readers.append(SnapshotReader(os.path.expanduser(new),
+                                                  decode=False))
+                    new_collections = readers[-1].collections()
+                else:
+                    new_collections = [
+                        self.snapshot_collection(path, records)
+                        for path, _, records in self.loaded_collections()]
+            except (IOError, OSError, ValueError) as error:
+                raise ExecutionError("Cannot compare: %s" % error)
+
+            totals = [0, 0, 0]
+            for old_collection, new_collection in merge_by_key(
+                    old_collections, new_collections,
+                    lambda collection: collection[0]['collection']):
+                if new is None and new_collection is None:
+                    # Not loaded, rather than empty.
+                    continue
+                self.display_diff(old_collection, new_collection, totals)
+        finally:
+            for reader in readers:
+                reader.close()
+        self.shell.log.info("%d added, %d removed, %d changed."
+                            % tuple(totals))
+
+    def snapshot_collection(self, path, records):
+        '''
+        Returns a loaded collection the way SnapshotReader.collections()
+        reads it from a snapshot, as a (description, rows) tuple.
+        '''
+        description = {
+            'collection': path,
+            'fields': list(records[0]._fields) if records else ['id'],
+        }
+        rows = ([encode(value) for value in record]
+                for record in sorted(records, key=lambda record: record.id))
+        return description, rows
+
+    def display_diff(self, old_collection, new_collection, totals):
+        '''
+        Displays the differences of the objects of a collection, and adds
+        their numbers of added, removed and changed objects to totals.
+        Collections missing on a side are compared as empty.
+        '''
+        old_description, old_rows = old_collection or (None, [])
+        new_description, new_rows = new_collection or (None, [])
+        path = (old_description or new_description)['collection']
+        old_fields = (old_description or new_description)['fields']
+        new_fields = (new_description or old_description)['fields']
+
+        def name(fields, row):
+            if 'name' in fields:
+                return row[fields.index('name')]
+            return row[0]
+
+        counts = [0, 0, 0]
+        lines = [path]
+        for old_row, new_row, changes in diff_rows(old_fields, old_rows,
+                                                   new_fields, new_rows):
+            if old_row is None:
+                counts[0] += 1
+                lines.append("  + %s" % name(new_fields, new_row))
+            elif new_row is None:
+                counts[1] += 1
+                lines.append("  - %s" % name(old_fields, old_row))
+            else:
+                counts[2] += 1
+                lines.append("  ~ %s: %s" % (
+                    name(new_fields, new_row),
+                    ', '.join("%s %s -> %s" % change for change in changes)))
+            # Display the differences as they are found, rather than keep
+            # them all.
+            if len(lines) >= diff_batch:
+                self.shell.con.display('\n'.join(lines))
+                lines = []
+        if any(counts):
+            lines.append("  %d added, %d removed, %d changed"
+                         % tuple(counts))
+            self.shell.con.display('\n'.join(lines))
+        for index, count in enumerate(counts):
+            totals[index] += count
+
+    def ui_complete_saveconfig(self, parameters, text, current_param):
         """
         Auto-completes the file name
         """
@@ -187,6 +705,11 @@ class UIRoot(UINode):
 
     ui_complete_restoreconfig = ui_complete_saveconfig
 
+    def ui_complete_diff(self, parameters, text, current_param):
+        if current_param not in ('old', 'new'):
+            return []
+        return self.ui_complete_saveconfig(parameters, text, 'savefile')
+
     def ui_command_version(self):
         """
         Displays the oVirtcli and support libraries versions.
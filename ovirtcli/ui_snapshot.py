@@ -0,0 +1,155 @@
+'''
+Implements the ovirt4cli read-only trees of inventory snapshots.
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may
+not use this file except in compliance with the License. You may obtain
+a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations
+under the License.
+'''
+
+from configshell_fb import ExecutionError
+
+from .snapshot import SnapshotReader
+from .ui_engine import UIEngine, ui_ovirtcli
+from .ui_node import UICollection, record_type
+
+# The snapshot classes of the collection UIs, by collection UI class.
+snapshot_classes = {}
+
+def snapshot_class(collection_class):
+    '''
+    Returns the class of the snapshot collections of a collection UI class:
+    they are listed, displayed and browsed the same way, from the snapshot.
+    '''
+    cls = snapshot_classes.get(collection_class)
+    if cls is None:
+        cls = type(collection_class.__name__,
+                   (SnapshotCollection, collection_class), {})
+        snapshot_classes[collection_class] = cls
+    return cls
+
+def load_snapshot(parent, name, path):
+    '''
+    Reads a snapshot file, and adds its tree to parent, as a UISnapshot
+    named name. The engines the snapshot has collections of, but the
+    default one, are UISnapshot children of it.
+    @return: The new UISnapshot node and its number of objects.
+    @raise ValueError: If the file is not a valid snapshot.
+    @raise IOError: If the file cannot be read.
+    '''
+    ui = ui_ovirtcli()
+    count = 0
+    with SnapshotReader(path) as reader:
+        snapshot = UISnapshot(name, parent, reader.header, '/')
+        try:
+            for description, rows in reader.collections():
+                engine_path, _, collection = \
+                    description['collection'].rpartition('/')
+                engine = snapshot
+                for engine_name in engine_path.split('/')[1:]:
+                    child = [node for node in engine.get_engines()[1:]
+                             if node.name == engine_name]
+                    if child:
+                        engine = child[0]
+                    else:
+                        engine = UISnapshot(engine_name, engine,
+                                            reader.header,
+                                            engine_path or '/')
+                collection_class = getattr(ui, description['type'], None)
+                if collection_class is None \
+                   or not issubclass(collection_class, UICollection):
+                    raise ValueError("Unknown collection type %s"
+                                     % description['type'])
+                record = record_type(description['fields'][1:])
+                records = [record._make(row) for row in rows]
+                snapshot_class(collection_class)(collection, engine, records)
+                count += len(records)
+        except:
+            parent.remove_child(snapshot)
+            raise
+    return snapshot, count
+
+
+class UISnapshot(UIEngine):
+    '''
+    The read-only tree of the collections of an engine saved in a snapshot
+    file, browsed without connecting to it.
+    @param header: The header of the snapshot, see write_snapshot().
+    @type header: dict
+    @param engine_path: The path the engine had in the saved tree.
+    @type engine_path: str
+    '''
+    def __init__(self, name, parent, header, engine_path):
+        UIEngine.__init__(self, name, parent)
+        self._header = header
+        self._ip = header.get('engines', {}).get(engine_path)
+
+    def get_engines(self):
+        return [self] + sorted([child for child in self._children
+                                if child.is_engine],
+                               key=lambda engine: engine.name)
+
+    def poll(self):
+        return False
+
+    def rebuild(self, incremental):
+        return []
+
+    def refresh(self):
+        # Snapshots do not change.
+        pass
+
+    def disconnect(self):
+        self.shell.log.info('Closed snapshot %s.' % self.name)
+
+    def summary(self):
+        return "Snapshot of %s taken %s" % (self._ip or 'engines',
+                                            self._header.get('time')), None
+
+
+class SnapshotCollection(object):
+    '''
+    Base class of the snapshot collections, see snapshot_class(). They
+    list the objects saved in the snapshot, and fail commands needing an
+    engine.
+    '''
+    paged = False
+
+    def __init__(self, name, parent, records):
+        UICollection.__init__(self, name, parent)
+        self._records = records
+
+    def __getattr__(self, name):
+        # The SDK services of the collection, used by its commands.
+        if name.endswith('_service'):
+            self.read_only()
+        raise AttributeError(name)
+
+    def read_only(self):
+        raise ExecutionError("%s is a read-only snapshot"
+                             % self.get_engine().path)
+
+    def fetch(self):
+        return self._records
+
+    def iter_pages(self):
+        yield self._records
+
+    def entity_service(self, entity_id):
+        self.read_only()
+
+    def search(self, query):
+        self.read_only()
+
+    def fetch_details(self, items, request):
+        self.read_only()
+
+    def count_active(self):
+        return None
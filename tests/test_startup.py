@@ -0,0 +1,66 @@
+'''
+Tests the ovirt4cli startup: the SDK is only imported once connected, and
+starting the CLI stays within the budgets of the startup benchmarks, see
+benchmarks/run.py.
+
+Licensed under the Apache License, Version 2.0 (the "License"); you may
+not use this file except in compliance with the License. You may obtain
+a copy of the License at
+
+    http://www.apache.org/licenses/LICENSE-2.0
+
+Unless required by applicable law or agreed to in writing, software
+distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+License for the specific language governing permissions and limitations
+under the License.
+'''
+
+import os
+import subprocess
+import sys
+import time
+
+import pytest
+
+top_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Runs of each timed command, the fastest of which is compared with its
+# budget, so that a busy machine does not fail the test.
+runs = 5
+
+def run_python(args, home):
+    '''
+    Runs a new Python interpreter in the repository, with its home in
+    home, and returns its exit status and output.
+    '''
+    env = dict(os.environ, HOME=str(home))
+    process = subprocess.run([sys.executable] + args, cwd=top_dir, env=env,
+                             stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                             universal_newlines=True)
+    return process.returncode, process.stdout
+
+def best_time(args, home):
+    '''
+    Returns the shortest time run_python(args) took in runs runs.
+    '''
+    times = []
+    for _ in range(runs):
+        start = time.time()
+        run_python(args, home)
+        times.append(time.time() - start)
+    return min(times)
+
+@pytest.mark.parametrize('module', ['ovirtcli', 'ovirtcli.ui_root'])
+def test_import_does_not_load_sdk(module, tmp_path):
+    status, output = run_python(
+        ['-c', 'import sys, %s; sys.exit("ovirtsdk4" in sys.modules)'
+         % module], tmp_path)
+    assert status == 0, output
+
+@pytest.mark.parametrize('args, budget', [
+    (['cli.py', '--version'], 0.1),
+    (['-c', 'import ovirtcli.ui_root'], 0.25),
+    (['cli.py', 'ls'], 0.4),
+])
+def test_startup_budget(args, budget, tmp_path):
+    assert best_time(args, tmp_path) < budget